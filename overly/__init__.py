@@ -1,4 +1,90 @@
-from .steps import *
-from .base import Server, ClientHandler
-from .constants import (HttpMethods, default_ssl_cert)
-from .socket_utils import *
+import sys
+from importlib import import_module
+
+# Everything is imported on first use rather than with overly, which is
+# a good deal quicker for anything that only needs some of it.
+_LAZY = {
+    ".base": ("Server", "ClientHandler"),
+    ".async_base": ("AsyncServer", "AsyncClientHandler"),
+    ".hooks": ("Hooks",),
+    ".logs": ("enable_logging", "disable_logging"),
+    ".certs": ("CertificateAuthority",),
+    ".constants": ("HttpMethods", "default_ssl_cert"),
+    ".socket_utils": (
+        "default_socket_factory",
+        "reuseport_socket_factory",
+        "default_socket_wrapper",
+        "ssl_socket_wrapper",
+        "server_ssl_context",
+        "new_server_ssl_context",
+    ),
+    ".bodies": ("Body", "RepeatingBody", "RandomBody", "FileBody", "RequestBody"),
+    ".steps": (
+        "finish",
+        "just_close",
+        "just_end",
+        "just_kill",
+        "send_request_as_json",
+        "accept_cookies_and_respond",
+        "prepare_cookies_response",
+        "send_gzip",
+        "send_deflate",
+        "send_chunked",
+        "send_200",
+        "send_file",
+        "send_range",
+        "send_200_blank_headers",
+        "send_204",
+        "send_3xx",
+        "send_301",
+        "send_302",
+        "send_303",
+        "send_304",
+        "send_400",
+        "send_403",
+        "send_404",
+        "send_405",
+        "method_check",
+        "send_500",
+        "receive_request",
+        "throttle",
+        "delay",
+        "async_delay",
+    ),
+}
+
+_MODULES = {name: module for module, names in _LAZY.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name):
+    try:
+        module = _MODULES[name]
+    except KeyError:
+        # Whatever else used to come along with the star imports of steps.
+        if name.startswith("_"):
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(__name__, name)
+            )
+        steps = import_module(".steps", __name__)
+        try:
+            value = getattr(steps, name)
+        except AttributeError:
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(__name__, name)
+            ) from None
+    else:
+        value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
+
+
+if sys.version_info < (3, 7):
+    # No module __getattr__, so in it all comes.
+    for _name in __all__:
+        globals()[_name] = __getattr__(_name)
@@ -0,0 +1,353 @@
+import sys
+import time
+import asyncio
+import inspect
+from collections import deque
+from socket import IPPROTO_TCP, TCP_NODELAY
+
+import h11
+
+from .base import Server, BaseClientHandler
+from .socket_utils import default_socket_wrapper
+from .bodies import RequestBody
+from .scheduler import Park
+from .errors import EndSteps, StepError
+
+from .errors import logger
+
+
+class AsyncServer(Server):
+    """
+    A Server which runs every connection as a coroutine on a single asyncio
+    event loop, rather than a thread per connection.
+
+    Takes the same arguments as Server. Plain steps work unchanged, and
+    steps returning an awaitable (like async_delay) are awaited.
+    TLS is set up by passing an ssl.SSLContext as ssl_context, as the
+    event loop does the wrapping rather than a socket_wrapper.
+    """
+
+    def __init__(self, location, *, ssl_context=None, **kwargs):
+        if kwargs.get("socket_wrapper", default_socket_wrapper) is not (
+            default_socket_wrapper
+        ):
+            raise ValueError(
+                "AsyncServer doesn't take a socket_wrapper, "
+                "pass an ssl_context instead."
+            )
+        if kwargs.get("workers") or kwargs.get("processes"):
+            raise ValueError(
+                "AsyncServer runs on a single thread, and takes no workers "
+                "or processes."
+            )
+        super().__init__(location, **kwargs)
+
+        self.ssl_context = ssl_context
+
+        self.loop = None
+        self.tasks = set()
+        self.writers = set()
+        self.in_flight = 0
+
+        # Created on the loop in serve.
+        self.finished = None
+        self.concurrency = None
+
+    def run_server(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()
+
+    async def serve(self):
+        s = self.socket_factory()
+        s.bind(self.location)
+        self.bound(s)
+        s.listen(self.listen_count)
+        s.setblocking(False)
+        self.server_sock = s
+
+        self.finished = asyncio.Event()
+        self.concurrency = asyncio.Semaphore(self.max_concurrency)
+
+        tls_kwargs = {}
+        if self.ssl_context is not None:
+            tls_kwargs["ssl"] = self.ssl_context
+            if sys.version_info >= (3, 7):
+                tls_kwargs["ssl_handshake_timeout"] = self.handshake_timeout
+
+        server = await asyncio.start_server(
+            self.accept_connection, sock=s, backlog=self.listen_count, **tls_kwargs
+        )
+
+        self.ready_to_go.set()
+
+        logger.info("Listening...")
+
+        try:
+            while not self.finished.is_set():
+                if self.kill_threads:
+                    logger.info("Client finished before max requests.")
+                    break
+                try:
+                    await asyncio.wait_for(self.finished.wait(), 0.1)
+                except asyncio.TimeoutError:
+                    ...
+        finally:
+            self.ready_to_go.clear()
+
+            server.close()
+            for writer in list(self.writers):
+                writer.close()
+            for task in list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await server.wait_closed()
+
+            logger.info("Server signaling to kill client threads.")
+            self.kill_threads = True
+
+    def accept_connection(self, reader, writer):
+        """
+        Called by the event loop for every new client, tracking the task
+        handling it so it can be cancelled on shutdown.
+        """
+        # asyncio only turns Nagle's algorithm off for socks made with
+        # IPPROTO_TCP, which ours and the ones accepted from them aren't.
+        sock = writer.get_extra_info("socket")
+        try:
+            sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        except (OSError, AttributeError):
+            # Not a TCP socket.
+            ...
+        logger.debug("New client request.")
+        task = self.loop.create_task(self.handle_connection(reader, writer))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve requests on a connection until it is closed, or stops
+        asking to be kept alive.
+        """
+        self.writers.add(writer)
+        connection_id = next(self.connection_ids)
+        self.connection_opened(connection_id)
+        kept_alive = False
+        try:
+            while True:
+                prefetched_data = await reader.read(65536)
+                if not prefetched_data or not self.requests_remaining():
+                    break
+                steps = None
+                if self.claim_request():
+                    steps, router = self.fetch_steps()
+                if steps is None:
+                    # The installed steps have served their max_requests, or
+                    # ordered steps have all been served.
+                    break
+
+                if self.metrics is not None:
+                    self.metrics.bytes_in.add(len(prefetched_data))
+                    if kept_alive:
+                        self.metrics.keep_alive_reuses.add()
+                kept_alive = True
+                self.in_flight += 1
+                try:
+                    async with self.concurrency:
+                        keep_alive = await AsyncClientHandler(
+                            self,
+                            reader,
+                            writer,
+                            self.http_test_url,
+                            self.https_test_url,
+                            steps=steps,
+                            router=router,
+                            prefetched_data=prefetched_data,
+                            connection_id=connection_id,
+                        ).run()
+                finally:
+                    self.in_flight -= 1
+                    if not self.requests_remaining() and not self.in_flight:
+                        self.finished.set()
+
+                if not keep_alive:
+                    logger.debug("Completed. Connection closed.")
+                    break
+                logger.debug("Completed. Connection kept alive.")
+
+        except (ConnectionError, h11.RemoteProtocolError):
+            ...
+        except Exception:
+            logger.exception("Client handler failed.")
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+            self.connection_closed(connection_id)
+
+
+class AsyncClientHandler(BaseClientHandler):
+    """
+    The coroutine counterpart to ClientHandler. Steps are handed this in
+    the same way, and use the same http_send interface.
+    """
+
+    def __init__(
+        self,
+        server,
+        reader,
+        writer,
+        http_test_url,
+        https_test_url,
+        *,
+        steps=None,
+        router=None,
+        prefetched_data=None,
+        connection_id=None,
+    ):
+        self.server = server
+
+        self.conn = h11.Connection(our_role=h11.SERVER)
+        self.reader = reader
+        self.writer = writer
+        self.sock = writer.get_extra_info("socket")
+        self.steps = steps
+
+        self.router = router
+
+        self.http_test_url = http_test_url
+        self.https_test_url = https_test_url
+
+        self.prefetched_data = prefetched_data
+
+        self.connection_id = connection_id
+        self.started_at = time.time()
+
+        # For use by builtin steps
+        self.request = None
+        self.request_body_buffer = RequestBody(server.request_body_spill_size)
+        self.multipart = None
+
+        self.raw_response_sent = False
+        self.throttle = None
+        self.hooks = None
+
+        # Output which synchronous steps can't wait on themselves: iterables
+        # of body chunks and awaitables, seen to after each step.
+        self.pending = deque()
+
+    async def run(self) -> bool:
+        """
+        Run the steps for a single request. Returns whether the connection
+        should be kept alive for another.
+        """
+        try:
+            await self.receive_request()
+            self.server.record_request(self)
+
+            self.get_steps()
+
+            for step in self.steps:
+                started = self.step_started(step)
+                try:
+                    result = step(self)
+                    if inspect.isawaitable(result):
+                        await result
+                    await self.flush()
+
+                    while isinstance(result, Park):
+                        await asyncio.sleep(result.seconds)
+                        if result.then is None:
+                            break
+                        result = result.then(self)
+                        await self.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client hung up on us, which may well be intentional.
+                    return False
+                except EndSteps:
+                    return False
+                finally:
+                    self.step_finished(step, started)
+
+            return self.detect_keepalive()
+        finally:
+            self.close_request_body()
+
+    async def receive_request(self):
+        request = await self.async_http_next_event()
+        self.start_request_body(request)
+        while True:
+            event = await self.async_http_next_event()
+            if isinstance(event, h11.EndOfMessage):
+                break
+            elif isinstance(event, h11.Data):
+                self.receive_body_data(event.data)
+
+        self.request = request
+
+    async def async_http_next_event(self):
+        while True:
+            event = self.conn.next_event()
+            if event is h11.NEED_DATA:
+                if self.prefetched_data is not None:
+                    data = self.prefetched_data
+                    self.prefetched_data = None
+                else:
+                    data = await self.reader.read(65536)
+                    if self.server.metrics is not None:
+                        self.server.metrics.bytes_in.add(len(data))
+                self.conn.receive_data(data)
+                continue
+            return event
+
+    def http_next_event(self):
+        """
+        For synchronous steps. As they can't wait on the client without
+        blocking the loop, only already received data is available.
+        """
+        event = self.conn.next_event()
+        if event is h11.NEED_DATA:
+            raise StepError(
+                "Synchronous steps can't wait for client data under AsyncServer."
+            )
+        return event
+
+    def write(self, data):
+        self.writer.write(data)
+        if self.server.metrics is not None:
+            self.server.metrics.bytes_out.add(len(data))
+
+    def http_send_chunks(self, chunks):
+        """
+        Queue chunks to be sent after the current step, so they're pulled
+        only as fast as the client takes them rather than piling up in
+        the transport.
+        """
+        self.pending.append(chunks)
+
+    def http_sendfile(self, body):
+        self.pending.append(self.sendfile(body))
+
+    async def sendfile(self, body):
+        with body.open() as file:
+            await self.server.loop.sendfile(
+                self.writer.transport, file, body.offset, body.size
+            )
+        self.raw_response_sent = True
+        if self.server.metrics is not None:
+            self.server.metrics.bytes_out.add(body.size)
+
+    async def flush(self):
+        while self.pending:
+            output = self.pending.popleft()
+            if inspect.isawaitable(output):
+                await output
+                continue
+            for chunk in output:
+                self.http_send(h11.Data(data=chunk))
+                await self.writer.drain()
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
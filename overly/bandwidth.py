@@ -0,0 +1,119 @@
+import time
+import random
+from threading import Lock
+
+import h11
+
+from .scheduler import Park
+
+
+class TokenBucket:
+    """
+    Allows rate bytes a second, in bursts of up to burst bytes. Waits are
+    varied by up to +/- jitter (a fraction) to make pacing less regular.
+    Safe to share between connections.
+    """
+
+    def __init__(self, rate: int, burst: int = None, jitter: float = 0):
+        self.rate = rate
+        self.burst = burst or max(rate // 10, 1)
+        self.jitter = jitter
+
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def take(self, n: int) -> int:
+        """
+        Take up to n tokens, returning how many we got.
+        """
+        with self.lock:
+            self.refill()
+            taken = max(min(n, int(self.tokens)), 0)
+            self.tokens -= taken
+            return taken
+
+    def give_back(self, n: int) -> None:
+        with self.lock:
+            self.tokens = min(self.tokens + n, self.burst)
+
+    def wait_time(self, n: int) -> float:
+        """
+        Roughly how long until n tokens are available.
+        """
+        with self.lock:
+            self.refill()
+            wait = max(min(n, self.burst) - self.tokens, 1) / self.rate
+        if self.jitter:
+            wait *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return wait
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+
+
+class ThrottledBody:
+    """
+    A step sending body chunks only as fast as the given buckets allow,
+    parking the client handler until there's more to be had.
+    """
+
+    __name__ = "throttled_body"
+
+    def __init__(self, chunks, buckets: [TokenBucket]):
+        self.chunks = iter(chunks)
+        self.buckets = buckets
+        self.remainder = None
+
+        # Tokens trickle back in continuously, so we wait for a burst's worth
+        # rather than sending whatever few bytes have come back each time.
+        self.quantum = min(bucket.burst for bucket in buckets)
+
+    def __call__(self, client_handler):
+        while True:
+            if self.remainder is not None:
+                chunk, self.remainder = self.remainder, None
+            else:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    return
+            if not len(chunk):
+                continue
+
+            wanted = min(len(chunk), self.quantum)
+            allowed = self.take(len(chunk))
+            if allowed < wanted:
+                self.give_back(allowed)
+                self.remainder = chunk
+                wait = max(bucket.wait_time(wanted) for bucket in self.buckets)
+                return Park(wait, then=self)
+
+            chunk = memoryview(chunk)
+            if allowed < len(chunk):
+                self.remainder = chunk[allowed:]
+            client_handler.http_send(h11.Data(data=chunk[:allowed]))
+
+    def take(self, n: int) -> int:
+        """
+        Take as many tokens as every bucket will give, up to n.
+        """
+        granted = []
+        for bucket in self.buckets:
+            n = bucket.take(n)
+            granted.append((bucket, n))
+            if not n:
+                break
+
+        # Earlier buckets may have given more than later ones would match.
+        for bucket, taken in granted:
+            if taken > n:
+                bucket.give_back(taken - n)
+
+        return n
+
+    def give_back(self, n: int) -> None:
+        if n:
+            for bucket in self.buckets:
+                bucket.give_back(n)
@@ -1,19 +1,28 @@
+import time
 from typing import Callable, Generator, Tuple
 
-from threading import Thread, BoundedSemaphore, Event
+from threading import Thread, BoundedSemaphore, Event, RLock
 from queue import Queue
 
-from select import poll
-from socket import socket
+import selectors
+from socket import socket, socketpair, timeout, IPPROTO_TCP, TCP_NODELAY, SHUT_RDWR
 
-from collections.abc import Sequence
 from collections import deque
+from itertools import count
 
 import h11
 
-from .socket_utils import default_socket_factory, default_socket_wrapper
-from .constants import HttpMethods, PollMaskGroups
-from .errors import EndSteps, MalformedStepError
+from .socket_utils import default_socket_factory, default_socket_wrapper, is_tls
+from .bodies import FileBody, RequestBody
+from .errors import EndSteps
+from .compiled import compile_steps
+from .routing import Router
+from .capture import RequestCapture
+from .metrics import Metrics, MetricsEndpoint
+from .handlers import BaseClientHandler
+from .workers import WorkerPool
+from .scheduler import Park, Scheduler
+from .bandwidth import TokenBucket
 
 from .errors import logger
 
@@ -29,18 +38,43 @@ class Server(Thread):
         socket_factory=default_socket_factory,
         socket_wrapper=default_socket_wrapper,
         sock_timeout=1,
+        handshake_timeout=10,
         steps=None,
         ordered_steps=False,
+        workers=None,
+        processes=None,
+        precompile_responses=True,
+        max_bandwidth=None,
+        request_body_spill_size=1024 ** 2,
+        multipart_files="memory",
+        capture=None,
+        metrics=False,
+        metrics_port=None,
+        hooks=None,
     ):
         super().__init__()
 
-        self.location = location
-        self.host = location[0]
-        self.port = location[1]
+        self.set_location(location)
 
+        # With max_requests=None we serve until stopped, and steps may be
+        # swapped with install. max_requests then caps each installed set.
+        self.persistent = max_requests is None
         self.max_requests = max_requests
         self.requests_count = 0
 
+        # When set, the last capture requests received are kept here.
+        self.captures = RequestCapture(capture) if capture else None
+        self.connection_ids = count()
+
+        # When set, timings and counts are kept, for stats and for scraping
+        # from metrics_port on our host.
+        self.metrics = Metrics() if metrics or metrics_port else None
+        self.metrics_port = metrics_port
+
+        # A Hooks instance, called on connections, requests and steps.
+        self.hooks = hooks
+
+        self.max_concurrency = max_concurrency
         self.sema = BoundedSemaphore(max_concurrency)
         self.queue = Queue()
         self.listen_count = listen_count
@@ -48,19 +82,55 @@ class Server(Thread):
         self.socket_factory = socket_factory
         self.socket_wrapper = socket_wrapper
 
-        self.steps = deque(steps)
-        self.ordered_steps = ordered_steps
-
-        # This could probably do with a little bit more inspection, for the use of
-        # more standard uris.
-        self.http_test_url = "http://{}:{}".format(location[0], str(location[1]))
-        self.https_test_url = "https://{}:{}".format(location[0], str(location[1]))
+        # When set, client handlers are run on a fixed pool of this many
+        # threads instead of a new thread each.
+        self.workers = workers
+        self.worker_pool = None
+
+        # Request bodies bigger than this are kept on disk rather than in memory.
+        self.request_body_spill_size = request_body_spill_size
+
+        # What's kept of the file parts of multipart bodies, which are parsed as
+        # they arrive: "memory", "disk" past the spill size, or "summary" for
+        # just their size and sha256. Summarized bodies aren't kept raw either.
+        if multipart_files not in ("memory", "disk", "summary"):
+            raise ValueError("multipart_files must be one of memory, disk or summary.")
+        self.multipart_files = multipart_files
+
+        # Caps the bytes a second sent across all connections, when set.
+        self.bandwidth = TokenBucket(max_bandwidth) if max_bandwidth else None
+
+        # Client handlers parked by steps like delay wait here, rather than
+        # each sleeping in a thread of their own. Without workers, they're
+        # resumed on a pool of threads kept for the purpose.
+        self.scheduler = None
+        self.resume_pool = None
+
+        # When set, the server is forked in to this many processes, each
+        # accepting from the same location.
+        if processes and ordered_steps:
+            raise ValueError("ordered_steps can't be kept across processes.")
+        if processes and self.persistent:
+            raise ValueError("processes need a max_requests to share.")
+        if processes and self.port == 0:
+            # Each would pick a port of its own.
+            raise ValueError("processes can't share port 0, pick a port.")
+        self.processes = processes
+        self.process_group = None
+
+        self.precompile_responses = precompile_responses
+        self.steps_lock = RLock()
+        self.set_steps(steps, ordered_steps)
 
         # socket queueing
         self.sock_timeout = sock_timeout
+        # TLS handshakes are done by client handlers, giving up after this.
+        self.handshake_timeout = handshake_timeout
         self.server_sock = None
         self.socket_manager = None
-        self.socket_handling_sema = BoundedSemaphore()
+        # Socks handed to client handlers and not yet done with, so they can
+        # be shut down on kill rather than leave a handler waiting on them.
+        self.client_socks = set()
 
         # This flag is set true upon either the max requests being reached, or
         # the decorated func completing / raising an exception. This is so threads
@@ -73,11 +143,53 @@ class Server(Thread):
         self.ready_to_go = Event()
 
     def run(self):
+        if not self.metrics_port:
+            self.run_server()
+            return
+
+        metrics_endpoint = MetricsEndpoint(self, (self.host, self.metrics_port))
+        metrics_endpoint.start()
+        try:
+            self.run_server()
+        finally:
+            metrics_endpoint.stop()
+
+    def run_server(self):
+        if self.processes:
+            # Only imported when needed, as multiprocessing is slow to import.
+            from .processes import ProcessGroup
+
+            ProcessGroup(self, self.processes).run()
+            return
+
         s = self.socket_factory()
         s.bind(self.location)
+        self.bound(s)
         s.listen(self.listen_count)
         s.settimeout(self.sock_timeout)
 
+        if self.workers:
+            self.worker_pool = WorkerPool(self.workers)
+            self.worker_pool.start()
+        else:
+            self.resume_pool = WorkerPool(0, max_size=self.max_concurrency)
+            self.resume_pool.start()
+
+        self.scheduler = Scheduler(self.resume_client)
+        self.scheduler.start()
+
+        try:
+            self.handle_clients(s)
+        finally:
+            self.scheduler.stop()
+            if self.socket_manager is not None:
+                self.socket_manager.close()
+            if self.worker_pool is not None:
+                self.worker_pool.shutdown()
+            if self.resume_pool is not None:
+                self.resume_pool.shutdown()
+
+    def handle_clients(self, s):
         with self.socket_wrapper(s) as s:
 
             self.server_sock = s
@@ -87,25 +199,49 @@ class Server(Thread):
 
             logger.info("Listening...")
 
-            while self.requests_count < self.max_requests:
+            while self.requests_remaining():
 
                 if self.kill_threads:
+                    if self.persistent:
+                        # Stopped, as is the only way for us to finish.
+                        break
                     raise SystemExit("Client finished before max requests.")
 
                 with self.sema:
 
-                    for sock, prefetched_data in self.socket_manager.get_socks():
+                    for (
+                        sock,
+                        prefetched_data,
+                        connection_id,
+                    ) in self.socket_manager.get_socks():
+                        steps = None
+                        if self.claim_request():
+                            steps, router = self.fetch_steps()
+                        if steps is None:
+                            # Another process served the last request, or the
+                            # installed steps have served theirs.
+                            sock.close()
+                            self.connection_closed(connection_id)
+                            continue
+
                         self.queue.put(1)
-                        ClientHandler(
+                        if prefetched_data is not None and self.metrics is not None:
+                            self.metrics.keep_alive_reuses.add()
+                        client_handler = ClientHandler(
                             self,
                             sock,
                             self.http_test_url,
                             self.https_test_url,
-                            steps=self.fetch_steps(),
+                            steps=steps,
+                            router=router,
                             prefetched_data=prefetched_data,
-                        ).start()
-
-                        self.requests_count += 1
+                            connection_id=connection_id,
+                        )
+                        self.client_socks.add(sock)
+                        if self.worker_pool is not None:
+                            self.worker_pool.submit(client_handler)
+                        else:
+                            client_handler.start()
 
         self.ready_to_go.clear()
 
@@ -113,17 +249,207 @@ class Server(Thread):
         logger.info("Server signaling to kill client threads.")
         self.kill_threads = True
 
-    def fetch_steps(self) -> list:
+    def resume_client(self, client_handler) -> None:
+        """
+        Carry on with a parked client handler's steps, on a worker if we
+        have them, or on the resume pool if not. Throttled bodies are parked
+        and resumed many times a response, so a thread each would churn.
         """
-        Get either the next step or all steps.
+        if self.worker_pool is not None:
+            self.worker_pool.submit(client_handler)
+        else:
+            self.resume_pool.submit(client_handler)
+
+    def claim_request(self) -> bool:
+        """
+        Count a request against max_requests. Returns False if there are none
+        left to be had, which can only happen when running in processes, or
+        when persistent and the installed steps have served max_requests.
+        """
+        if self.process_group is not None and not self.process_group.claim_request():
+            return False
+        if (
+            self.persistent
+            and self.max_requests is not None
+            and self.requests_count >= self.max_requests
+        ):
+            return False
+        self.requests_count += 1
+        return True
+
+    def requests_remaining(self) -> bool:
+        if self.persistent:
+            return True
+        if self.process_group is not None:
+            return self.process_group.requests_remaining()
+        return self.requests_count < self.max_requests
+
+    def set_location(self, location) -> None:
+        self.location = location
+        self.host = location[0]
+        self.port = location[1]
+
+        # This could probably do with a little bit more inspection, for the use of
+        # more standard uris.
+        self.http_test_url = "http://{}:{}".format(location[0], str(location[1]))
+        self.https_test_url = "https://{}:{}".format(location[0], str(location[1]))
+
+    def bound(self, sock) -> None:
+        """
+        Called once our listening sock is bound. If we were given port 0,
+        take the port the OS picked, so the test urls are right, and compile
+        the steps again as their responses may include them.
+        """
+        if self.port == 0:
+            self.set_location((self.host, sock.getsockname()[1]))
+            with self.steps_lock:
+                self.set_steps(self.source_steps, self.ordered_steps)
+
+    def set_steps(self, steps, ordered_steps=False) -> None:
+        """
+        Set the steps to be run for requests from here on.
+        """
+        source_steps = steps
+        # Steps whose responses don't depend on the request are serialized once
+        # here, rather than for every request.
+        if self.precompile_responses:
+            steps = compile_steps(steps, self)
+        steps = deque(steps)
+
+        # (HttpMethods, path) prefixed steps are routed by an index built here,
+        # one per step when they're ordered.
+        router = None
+        routers = None
+        if ordered_steps:
+            routers = deque(Router.from_steps([step]) for step in steps)
+        else:
+            router = Router.from_steps(steps)
+
+        with self.steps_lock:
+            self.source_steps = source_steps
+            self.steps = steps
+            self.ordered_steps = ordered_steps
+            self.router = router
+            self.routers = routers
+
+    def install(self, steps, *, ordered_steps=False, max_requests=None) -> None:
+        """
+        Swap in new steps on a running server made with max_requests=None,
+        and start counting requests afresh. Any captured requests and stats
+        are cleared too. max_requests caps how many requests the new steps
+        serve, after which connections are closed until the next install.
+
+        Saves starting a server for every test, see overly.pytest_plugin.
+        """
+        if not self.persistent:
+            raise ValueError("Only servers made with max_requests=None can install.")
+        with self.steps_lock:
+            self.set_steps(steps, ordered_steps)
+            self.max_requests = max_requests
+            self.requests_count = 0
+            if self.captures is not None:
+                self.captures.clear()
+            if self.metrics is not None:
+                metrics = Metrics()
+                metrics.connections.set(self.metrics.connections.value)
+                self.metrics = metrics
+
+    def stop(self) -> None:
+        """
+        Stop a running server, without waiting on max_requests, and wait
+        for it to finish.
+        """
+        self.kill()
+        self.join()
+
+    def kill(self) -> None:
+        """
+        Tell the server and its client handlers to finish up, waking any
+        waiting on clients and letting go of any parked.
+        """
+        self.kill_threads = True
+        if self.socket_manager is not None:
+            self.socket_manager.wakeup()
+        self.shutdown_client_socks()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def shutdown_client_socks(self) -> None:
+        """
+        Shut down the socks of client handlers still going, which wakes any
+        blocked waiting on a client, to find kill_threads set.
+        """
+        for sock in list(self.client_socks):
+            try:
+                sock.shutdown(SHUT_RDWR)
+            except OSError:
+                # Already closed.
+                ...
+
+    def record_request(self, client_handler) -> None:
+        """
+        Called by client handlers once they've received a request.
+        """
+        if self.metrics is not None:
+            self.metrics.requests.add()
+        if self.hooks is not None and self.hooks.sampled():
+            client_handler.hooks = self.hooks
+            self.hooks.on_request_parsed(client_handler)
+        if self.captures is None:
+            return
+        record = client_handler.capture_request()
+        if self.process_group is not None:
+            self.process_group.record_request(record)
+        else:
+            self.captures.append(record)
+
+    def connection_opened(self, connection_id: int) -> None:
+        if self.metrics is not None:
+            self.metrics.connections.inc()
+            self.metrics.sample_accept_queue(self.server_sock)
+        if self.hooks is not None:
+            self.hooks.on_connection(self, connection_id)
+
+    def connection_closed(self, connection_id: int) -> None:
+        if self.metrics is not None:
+            self.metrics.connections.dec()
+        if self.hooks is not None:
+            self.hooks.on_close(self, connection_id)
+
+    def stats(self) -> dict:
+        """
+        Counts and step timings so far. Requires the server be made with
+        metrics=True.
+        """
+        if self.metrics is None:
+            raise ValueError("Pass metrics=True to Server to keep stats.")
+        if self.server_sock is not None:
+            self.metrics.sample_accept_queue(self.server_sock)
+        return self.metrics.stats()
+
+    def captured(self, method=None, path=None, connection_id=None) -> list:
+        """
+        The captured requests matching all of the given criteria, oldest
+        first. Requires the server be made with capture=N.
+        """
+        if self.captures is None:
+            raise ValueError("Pass capture=N to Server to capture requests.")
+        return self.captures.query(method, path, connection_id)
+
+    def fetch_steps(self) -> (list, Router):
+        """
+        Get either the next step or all steps, and the router for them.
         When the steps are ordered, each is equiv to a full step
-        as defined in the most basic case.
+        as defined in the most basic case, and once they've all been
+        served we get (None, None).
         """
-        if self.ordered_steps:
-            x = [self.steps.popleft()]
-            return x
+        with self.steps_lock:
+            if self.ordered_steps:
+                if not self.steps:
+                    return None, None
+                return [self.steps.popleft()], self.routers.popleft()
 
-        return self.steps
+            return self.steps, self.router
 
     def __call__(self, func: Callable) -> Callable:
         """
@@ -139,8 +465,7 @@ class Server(Thread):
                 return result
             finally:
                 logger.info("Decorator exit signaling to kill client threads.")
-                self.kill_threads = True
-                self.join()
+                self.stop()
 
         return inner
 
@@ -148,100 +473,140 @@ class Server(Thread):
 class SocketManager:
     """
     Handles getting new client sockets, and registered sockets making requests.
+
+    Only the server's thread touches the selector. Other threads hand socks
+    back through register_sock, which queues them and wakes the selector so
+    they are watched straight away.
     """
 
     def __init__(self, server: Server):
         self.server = server
 
-        self.server_sock_fileno = server.server_sock.fileno()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server.server_sock, selectors.EVENT_READ)
+
+        self.wakeup_reader, self.wakeup_writer = socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
 
-        self.socket_filenos = {}
-        self.poller = poll()
-        self.register_sock(self.server.server_sock)
+        self.pending_socks = deque()
 
-    def get_socks(self) -> Generator[Tuple[(socket, bytes)], None, None]:
+    def get_socks(self) -> Generator[Tuple[(socket, bytes, int)], None, None]:
         """
         Get registered socks that are active and sending data, or
         new clients coming in from the server's listening sock.
         """
-        with self.server.socket_handling_sema:
-            for sock, prefetched_data in self.get_readable_socks():
-                try:
-                    self.unregister_sock(sock)
-                except KeyError:
-                    # Already unregistered, or never registered.
-                    ...
-                yield sock, prefetched_data
+        self.register_pending_socks()
+        yield from self.get_readable_socks()
 
-    def get_readable_socks(self) -> Generator[Tuple[(socket, bytes)], None, None]:
+    def get_readable_socks(
+        self,
+    ) -> Generator[Tuple[(socket, bytes, int)], None, None]:
         """
-        Get any registered sockets the OS says are read/writeable.
+        Get any registered sockets the OS says are readable.
         Test their state, junking ones we don't like and yielding out
         ones we do like.
         """
         junk_keepalive_socks = []
 
-        for fileno, state in self.poller.poll(0.1):
+        for key, _ in self.selector.select(self.server.sock_timeout):
+            sock = key.fileobj
+
+            if sock is self.wakeup_reader:
+                self.drain_wakeups()
 
-            if fileno == self.server_sock_fileno:
-                if state in PollMaskGroups.READ_WRITE_SIMPLE:
+            elif sock is self.server.server_sock:
+                try:
                     new_client, _ = self.server.server_sock.accept()
-                    logger.info("New client request.")
-                    yield new_client, None
+                except (BlockingIOError, timeout):
+                    continue
+                # Responses go out as several small writes, which Nagle's
+                # algorithm would otherwise hold back waiting on acks.
+                try:
+                    new_client.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+                except OSError:
+                    # Not a TCP socket.
+                    ...
+                connection_id = next(self.server.connection_ids)
+                self.server.connection_opened(connection_id)
+                logger.debug("New client request.")
+                yield new_client, None, connection_id
 
-            elif state in PollMaskGroups.READ_WRITES:
-                sock = self.socket_filenos[fileno]
-                data = sock.recv(1)
+            else:
+                self.unregister_sock(sock)
+                try:
+                    data = sock.recv(1)
+                except OSError:
+                    data = b""
 
                 # test for liveliness
                 if data == b"":
-                    junk_keepalive_socks.append(sock)
+                    junk_keepalive_socks.append((sock, key.data))
                 else:
-                    logger.info("Keepalive request.")
-                    yield sock, data
-
-            elif state in PollMaskGroups.WRITE_SIMPLE:
-                # TODO Configurable max lifetime for sockets.
-                ...
-
-            elif state in PollMaskGroups.BADS:
-                junk_keepalive_socks.append(fileno)
-
-            else:
-                raise RuntimeError("Unsupported socket poll mask.")
+                    logger.debug("Keepalive request.")
+                    yield sock, data, key.data
 
         self.remove_junk_socks(junk_keepalive_socks)
 
-    def remove_junk_socks(self, junk_socks: [int]) -> None:
+    def remove_junk_socks(self, junk_socks: [(socket, int)]) -> None:
         """
-        Unregister and throw away smelly socks.
+        Throw away smelly socks.
         """
-        for fileno in junk_socks:
-            try:
-                sock = self.socket_filenos[fileno]
-                self.unregister_sock(sock)
-                sock.close()
-                logger.info("Junked {}".format(fileno))
-            except KeyError:
-                ...
+        for sock, connection_id in junk_socks:
+            logger.debug("Junked %s", sock.fileno())
+            sock.close()
+            self.server.connection_closed(connection_id)
 
-    def register_sock(self, sock: socket) -> None:
+    def register_sock(self, sock: socket, connection_id: int = None) -> None:
         """
-        Register the given sock with the polling object, and internal dict.
+        Queue the given sock to be watched for another request.
+        Safe to call from any thread.
         """
-        self.poller.register(sock)
-        self.socket_filenos[sock.fileno()] = sock
+        self.pending_socks.append((sock, connection_id))
+        self.wakeup()
+
+    def register_pending_socks(self) -> None:
+        while self.pending_socks:
+            sock, connection_id = self.pending_socks.popleft()
+            self.selector.register(sock, selectors.EVENT_READ, connection_id)
 
     def unregister_sock(self, sock: socket) -> None:
+        self.selector.unregister(sock)
+
+    def wakeup(self) -> None:
+        """
+        Interrupt a blocking select.
+        """
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            # Either a wakeup is already pending, or we're closed.
+            ...
+
+    def drain_wakeups(self) -> None:
+        try:
+            while self.wakeup_reader.recv(1024):
+                ...
+        except BlockingIOError:
+            ...
+        self.register_pending_socks()
+
+    def close(self) -> None:
         """
-        Unregister the given sock with the polling object, and internal dict.
+        Close any kept alive socks still waiting on requests, and our selector.
         """
-        fileno = sock.fileno()
-        self.poller.unregister(fileno)
-        del self.socket_filenos[fileno]
+        self.register_pending_socks()
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj is not self.server.server_sock:
+                key.fileobj.close()
+                if key.data is not None:
+                    self.server.connection_closed(key.data)
+        self.selector.close()
+        self.wakeup_writer.close()
 
 
-class ClientHandler(Thread):
+class ClientHandler(BaseClientHandler, Thread):
     def __init__(
         self,
         server,
@@ -250,7 +615,9 @@ class ClientHandler(Thread):
         https_test_url,
         *,
         steps=None,
+        router=None,
         prefetched_data=None,
+        connection_id=None,
     ):
         super().__init__()
         self.server = server
@@ -259,31 +626,48 @@ class ClientHandler(Thread):
         self.sock = sock
         self.steps = steps
 
-        self.step_map = self._construct_step_map()
+        self.router = router
 
         self.http_test_url = http_test_url
         self.https_test_url = https_test_url
 
         self.prefetched_data = prefetched_data
 
+        self.connection_id = connection_id
+        self.started_at = time.time()
+
         # For use by builtin steps
         self.request = None
-        self.request_body = b""
+        self.request_body_buffer = RequestBody(server.request_body_spill_size)
+        self.multipart = None
 
-    def run(self):
-        self.server.queue.get()
-        self.receive_request()
+        self.raw_response_sent = False
+        self.throttle = None
+        self.hooks = None
 
-        self.get_steps()
+        # Where we're at in our steps, kept for when we're parked.
+        self.step_iter = None
+        self.continuation = None
 
+    def run(self):
+        parked = False
+        kept_alive = False
         try:
-            for step in self.steps:
+            # Parked handlers are run again to resume their steps.
+            if self.request is None:
+                self.server.queue.get()
+                if not self.tls_handshake():
+                    self.sock.close()
+                    return
+                self.receive_request()
+                self.server.record_request(self)
+
+                self.get_steps()
+                self.step_iter = iter(self.steps)
+
+            for step in self.next_steps():
                 try:
-                    logger.info("Step: {}".format(step.__name__))
-                except AttributeError:
-                    logger.info("Step: {}".format(step.func.__name__))
-                try:
-                    step(self)
+                    result = self.run_step(step)
                 except BrokenPipeError:
                     # Currently we suppress the case of trying to send data to the
                     # client, but the client has already closed their socket.
@@ -296,78 +680,74 @@ class ClientHandler(Thread):
                     # This is a control flow exception which indicates that we
                     # want to end the client as soon as possible.
                     ...
+                else:
+                    if isinstance(result, Park):
+                        self.continuation = result.then
+                        if self.server.scheduler is None:
+                            time.sleep(result.seconds)
+                            continue
+                        self.server.scheduler.park(self, result.seconds)
+                        parked = True
+                        return
             else:
-                with self.server.socket_handling_sema:
-                    if self.detect_keepalive():
-                        self.server.socket_manager.register_sock(self.sock)
-                        logger.info("Completed. Connection kept alive.")
-                    else:
-                        self.sock.close()
-                        logger.info("Completed. Connection closed.")
+                if self.detect_keepalive():
+                    self.server.socket_manager.register_sock(
+                        self.sock, self.connection_id
+                    )
+                    kept_alive = True
+                    logger.debug("Completed. Connection kept alive.")
+                else:
+                    self.sock.close()
+                    logger.debug("Completed. Connection closed.")
         finally:
-            self.server.queue.task_done()
+            if not parked:
+                self.release(kept_alive)
 
-    def detect_keepalive(self) -> bool:
+    def release(self, kept_alive=False) -> None:
         """
-        Figure out if the client has requested a keep-alive connection.
+        Let the server know we're done, and close our sock unless it's been
+        handed back to be kept alive. Parked handlers abandoned by the
+        scheduler are released by it.
         """
-        return next(
-            (
-                True
-                for header, value in self.request.headers
-                if (header, value) == (b"connection", b"keep-alive")
-            ),
-            False,
-        )
-
-    def get_steps(self):
+        self.close_request_body()
+        self.server.client_socks.discard(self.sock)
+        self.server.queue.task_done()
+        if not kept_alive:
+            self.sock.close()
+            self.server.connection_closed(self.connection_id)
+
+    def tls_handshake(self) -> bool:
         """
-        If there is a step map, pull the steps for the current request
-        from the mapping. Steps are mapped by tuple(HttpMethod, uri).
-
-        Sets self.steps equal to the found steps from the mapping.
-
-        If there is no step map, do nothing.
+        Do the TLS handshake for a newly accepted sock, which the accept loop
+        leaves to us so that one slow client can't hold up the rest. Returns
+        False if it failed or took longer than the server's handshake_timeout.
         """
-        if self.step_map is not None:
-
-            try:
-                self.steps = self.step_map[
-                    (
-                        HttpMethods(self.request.method.decode()),
-                        self.request.target.decode(),
-                    )
-                ]
-
-            except KeyError:
-                self.sock.close()
-                raise MalformedStepError(
-                    "Couldn't find matching step "
-                    "for metohd {} at target {}".format(
-                        self.request.method.decode(), self.request.target.decode()
-                    )
-                )
-
-    def _construct_step_map(self):
+        if not is_tls(self.sock) or self.sock.version() is not None:
+            return True
+        timeout = self.sock.gettimeout()
+        self.sock.settimeout(self.server.handshake_timeout)
+        try:
+            self.sock.do_handshake()
+        except OSError as e:
+            logger.debug("TLS handshake failed: %s", e)
+            return False
+        self.sock.settimeout(timeout)
+        return True
+
+    def next_steps(self):
         """
-        Create a mapping for each step, where the key is a tuple
-        of the method and path, and the value is a list of steps to run.
+        Yield the steps left to run, starting with any continuation
+        left by the step that parked us.
         """
-        step_map = {}
-        for step in self.steps:
-            if isinstance(step, Sequence):
-                try:
-                    http_method, path = step[0]
-                    assert isinstance(http_method, HttpMethods)
-                    assert isinstance(path, str)
-                except (AssertionError, IndexError, ValueError, TypeError):
-                    raise MalformedStepError(
-                        "0th elem of multi step sequences "
-                        "must be formed: (HttpMethods, str)"
-                    )
-                step_map[(http_method, path)] = step[1:]
-
-        return step_map or None
+        while True:
+            if self.continuation is not None:
+                step, self.continuation = self.continuation, None
+                yield step
+                continue
+            try:
+                yield next(self.step_iter)
+            except StopIteration:
+                return
 
     def receive_request(self):
         """
@@ -376,12 +756,13 @@ class ClientHandler(Thread):
         when multiple steps are defined.
         """
         request = self.http_next_event()
+        self.start_request_body(request)
         while True:
             event = self.http_next_event()
             if isinstance(event, h11.EndOfMessage):
                 break
             elif isinstance(event, h11.Data):
-                self.request_body += event.data
+                self.receive_body_data(event.data)
 
         self.request = request
 
@@ -392,16 +773,38 @@ class ClientHandler(Thread):
             event = self.conn.next_event()
             if event is h11.NEED_DATA:
                 if self.prefetched_data is not None:
-                    data = self.prefetched_data + self.sock.recv(2048)
+                    data = self.prefetched_data + self.sock.recv(65536)
                     self.prefetched_data = None
                 else:
-                    data = self.sock.recv(2048)
+                    data = self.sock.recv(65536)
+                if self.server.kill_threads:
+                    # Woken by the server shutting our sock down.
+                    raise SystemExit
+                if self.server.metrics is not None:
+                    self.server.metrics.bytes_in.add(len(data))
                 self.conn.receive_data(data)
                 continue
             return event
 
-    def http_send(self, *events):
-        for event in events:
-            data = self.conn.send(event)
-            if data is not None:
-                self.sock.sendall(data)
+    def write(self, data):
+        self.sock.sendall(data)
+        if self.server.metrics is not None:
+            self.server.metrics.bytes_out.add(len(data))
+
+    def http_sendfile(self, body: FileBody):
+        """
+        Send a FileBody as the rest of the response body, with os.sendfile
+        if the socket isn't TLS. h11 doesn't see the body go out, so the
+        response is done with as far as it's concerned.
+        """
+        if is_tls(self.sock):
+            return super().http_sendfile(body)
+
+        with body.open() as file:
+            self.sock.sendfile(file, body.offset, body.size)
+        self.raw_response_sent = True
+        if self.server.metrics is not None:
+            self.server.metrics.bytes_out.add(body.size)
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,499 @@
+"""
+How fast can overly serve? Starts a server in a process of its own and
+hammers it from local client processes.
+
+    python -m overly.bench
+    python -m overly.bench --steps 200 json gzip --modes threads async --tls
+
+For every combination of step set and mode given this prints requests per
+second, latency percentiles and the server's CPU time per request, which
+is enough to spot a regression in the request path.
+
+    python -m overly.bench --imports --import-budget 180
+
+times importing overly instead, failing if importing a Server and some
+steps takes over 180ms. Timings vary by machine, so set the budget a
+little above what --imports gives on yours, to catch the next regression
+rather than only the ones before it.
+"""
+
+__all__ = ["STEP_SETS", "MODES", "IMPORTS", "bench", "import_times"]
+
+import os
+import ssl
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+import resource
+import statistics
+import subprocess
+import multiprocessing
+from functools import partial
+
+from .base import Server
+from .async_base import AsyncServer
+from .socket_utils import ssl_socket_wrapper, server_ssl_context
+from .steps import (
+    finish,
+    send_200,
+    send_request_as_json,
+    send_chunked,
+    send_gzip,
+)
+
+
+STEP_SETS = {
+    "200": [send_200, finish],
+    "json": [send_request_as_json, finish],
+    "chunked": [partial(send_chunked, data=[b"x" * 1024] * 16), finish],
+    "gzip": [partial(send_gzip, data=b"overly " * 4096), finish],
+}
+
+# What import_times times, by name.
+IMPORTS = {
+    "overly": "import overly",
+    "server": "from overly import Server, send_200, finish",
+    "async": "from overly import AsyncServer, send_200, finish",
+    "json": "from overly import Server, send_request_as_json, finish",
+}
+
+# Mode name to the server class and kwargs used to build it. Sizes are
+# filled in from the command line.
+MODES = {
+    "threads": (Server, {}),
+    "workers": (Server, {"workers": None}),
+    "async": (AsyncServer, {}),
+    "processes": (Server, {"processes": None}),
+}
+
+
+def bench(
+    steps="200",
+    mode="threads",
+    *,
+    requests=5000,
+    concurrency=8,
+    clients=1,
+    keep_alive=True,
+    tls=False,
+    workers=8,
+    processes=None,
+    server_kwargs=None,
+) -> dict:
+    """
+    Serve requests with a step set from STEP_SETS in a mode from MODES,
+    and return what it cost. Latencies are in seconds and cpu_per_request
+    is the server's user and system time over requests.
+
+    concurrency connections are spread across clients load generating
+    processes. Without keep_alive every request makes a new connection,
+    so with tls it measures handshakes.
+    """
+    if concurrency > requests:
+        concurrency = requests
+    clients = max(1, min(clients, concurrency))
+
+    location = ("localhost", _free_port())
+    server_ready = multiprocessing.Event()
+    server_results = multiprocessing.Queue()
+    server_process = multiprocessing.Process(
+        target=_serve,
+        args=(
+            location,
+            steps,
+            mode,
+            requests,
+            concurrency,
+            tls,
+            workers,
+            processes or os.cpu_count(),
+            server_kwargs or {},
+            server_ready,
+            server_results,
+        ),
+    )
+    server_process.start()
+    if not server_ready.wait(10):
+        server_process.terminate()
+        raise RuntimeError("Server didn't start.")
+
+    # Every connection makes its share of the requests.
+    shares = [
+        requests // concurrency + (index < requests % concurrency)
+        for index in range(concurrency)
+    ]
+    client_results = multiprocessing.Queue()
+    client_processes = [
+        multiprocessing.Process(
+            target=_load,
+            args=(location, shares[index::clients], keep_alive, tls, client_results),
+            daemon=True,
+        )
+        for index in range(clients)
+    ]
+    for process in client_processes:
+        process.start()
+
+    latencies = []
+    started = None
+    ended = None
+    errors = 0
+    for _ in client_processes:
+        result = client_results.get()
+        if isinstance(result, BaseException):
+            server_process.terminate()
+            raise RuntimeError("Load generator failed.") from result
+        client_latencies, client_started, client_ended, client_errors = result
+        latencies.extend(client_latencies)
+        started = client_started if started is None else min(started, client_started)
+        ended = client_ended if ended is None else max(ended, client_ended)
+        errors += client_errors
+    for process in client_processes:
+        process.join()
+
+    cpu = server_results.get(timeout=30)
+    server_process.join(10)
+
+    latencies.sort()
+    elapsed = ended - started
+    completed = len(latencies)
+    return {
+        "steps": steps,
+        "mode": mode,
+        "tls": tls,
+        "keep_alive": keep_alive,
+        "requests": completed,
+        "errors": errors,
+        "seconds": elapsed,
+        "requests_per_second": completed / elapsed if elapsed else None,
+        "p50": _percentile(latencies, 50),
+        "p99": _percentile(latencies, 99),
+        "p999": _percentile(latencies, 99.9),
+        "cpu_per_request": cpu / completed if completed else None,
+    }
+
+
+def import_times(runs=20) -> dict:
+    """
+    The median milliseconds each of IMPORTS takes, in a fresh interpreter
+    every run so nothing's already imported.
+    """
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (package_dir, env.get("PYTHONPATH")) if path
+    )
+    code = (
+        "import time\n"
+        "started = time.perf_counter()\n"
+        "{}\n"
+        "print(time.perf_counter() - started)\n"
+    )
+
+    times = {}
+    for name, statement in IMPORTS.items():
+        samples = [
+            float(
+                subprocess.check_output(
+                    [sys.executable, "-c", code.format(statement)], env=env
+                )
+            )
+            for _ in range(runs)
+        ]
+        times[name] = statistics.median(samples) * 1000
+    return times
+
+
+# --------------
+# Server side
+# --------------
+
+
+def _serve(
+    location,
+    steps,
+    mode,
+    requests,
+    concurrency,
+    tls,
+    workers,
+    processes,
+    server_kwargs,
+    ready,
+    results,
+):
+    server_class, mode_kwargs = MODES[mode]
+    kwargs = {
+        "max_requests": requests,
+        "listen_count": max(concurrency * 2, 128),
+        "steps": STEP_SETS[steps],
+    }
+    if "workers" in mode_kwargs:
+        kwargs["workers"] = workers
+    if "processes" in mode_kwargs:
+        kwargs["processes"] = processes
+    if tls:
+        if server_class is AsyncServer:
+            kwargs["ssl_context"] = server_ssl_context()
+        else:
+            kwargs["socket_wrapper"] = ssl_socket_wrapper
+    kwargs.update(server_kwargs)
+
+    server = server_class(location, **kwargs)
+    server.start()
+    server.ready_to_go.wait()
+    before = _cpu_time()
+    ready.set()
+    server.join()
+    results.put(_cpu_time() - before)
+
+
+def _cpu_time() -> float:
+    # Children are included for processes mode, whose children we've
+    # waited on by the time the server is joined.
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        self_usage.ru_utime
+        + self_usage.ru_stime
+        + children_usage.ru_utime
+        + children_usage.ru_stime
+    )
+
+
+# --------------
+# Client side
+# --------------
+
+
+def _load(location, shares, keep_alive, tls, results):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        latencies = []
+        errors = []
+        ssl_context = None
+        if tls:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+        started = time.perf_counter()
+        loop.run_until_complete(
+            asyncio.gather(
+                *(
+                    _connection(
+                        location, share, keep_alive, ssl_context, latencies, errors
+                    )
+                    for share in shares
+                )
+            )
+        )
+        ended = time.perf_counter()
+        results.put((latencies, started, ended, len(errors)))
+    except BaseException as e:
+        # So the parent isn't left waiting on us.
+        results.put(e)
+        raise
+    finally:
+        loop.close()
+
+
+async def _connection(location, share, keep_alive, ssl_context, latencies, errors):
+    host, port = location
+    request = (
+        "GET / HTTP/1.1\r\n"
+        "host: {}:{}\r\n"
+        "connection: {}\r\n"
+        "\r\n".format(host, port, "keep-alive" if keep_alive else "close")
+    ).encode()
+
+    reader = writer = None
+    for _ in range(share):
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    host, port, ssl=ssl_context
+                )
+                writer.get_extra_info("socket").setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+                )
+            writer.write(request)
+            await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(e)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def _read_response(reader) -> None:
+    """
+    Read a response off reader, going by its framing headers rather than
+    the connection closing, as overly keeps alive whatever it says.
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    content_length = None
+    chunked = False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            content_length = int(value)
+        elif name == b"transfer-encoding" and b"chunked" in value.lower():
+            chunked = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if not size:
+                # Any trailers, then the empty line ending them.
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    ...
+                return
+            await reader.readexactly(size + 2)
+    elif content_length is not None:
+        await reader.readexactly(content_length)
+    else:
+        await reader.read()
+
+
+# --------------
+# Odds and ends
+# --------------
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[index]
+
+
+def _format_row(result) -> str:
+    def ms(seconds):
+        return "-" if seconds is None else "{:.2f}".format(seconds * 1000)
+
+    return "{:<8} {:<10} {:<4} {:>8} {:>10} {:>8} {:>8} {:>8} {:>10} {:>6}".format(
+        result["steps"],
+        result["mode"],
+        "tls" if result["tls"] else "",
+        result["requests"],
+        "{:.0f}".format(result["requests_per_second"] or 0),
+        ms(result["p50"]),
+        ms(result["p99"]),
+        ms(result["p999"]),
+        "{:.0f}".format((result["cpu_per_request"] or 0) * 1000000),
+        result["errors"],
+    )
+
+
+_HEADER = "{:<8} {:<10} {:<4} {:>8} {:>10} {:>8} {:>8} {:>8} {:>10} {:>6}".format(
+    "steps",
+    "mode",
+    "",
+    "requests",
+    "req/s",
+    "p50 ms",
+    "p99 ms",
+    "p999 ms",
+    "cpu us/req",
+    "errors",
+)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m overly.bench", description=__doc__.split("\n\n")[0].strip()
+    )
+    parser.add_argument(
+        "--steps", nargs="+", choices=sorted(STEP_SETS), default=["200"]
+    )
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--clients", type=int, default=1, help="load generating processes"
+    )
+    parser.add_argument(
+        "--no-keep-alive",
+        dest="keep_alive",
+        action="store_false",
+        help="make a new connection for every request",
+    )
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--json", action="store_true", help="print results as json lines"
+    )
+    parser.add_argument(
+        "--imports", action="store_true", help="time importing overly instead"
+    )
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        metavar="MS",
+        help="with --imports, fail if importing a Server and steps takes longer",
+    )
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        times = import_times()
+        if args.json:
+            print(json.dumps(times))
+        else:
+            for name, milliseconds in times.items():
+                print("{:<8} {:>8.1f} ms  {}".format(name, milliseconds, IMPORTS[name]))
+        # import overly alone imports next to nothing, so what's budgeted is
+        # what a test would actually import.
+        if args.import_budget is not None and times["server"] > args.import_budget:
+            sys.exit(
+                "{} took {:.1f}ms, over the {}ms budget.".format(
+                    IMPORTS["server"], times["server"], args.import_budget
+                )
+            )
+        return
+
+    if not args.json:
+        print(_HEADER)
+    for steps in args.steps:
+        for mode in args.modes:
+            result = bench(
+                steps,
+                mode,
+                requests=args.requests,
+                concurrency=args.concurrency,
+                clients=args.clients,
+                keep_alive=args.keep_alive,
+                tls=args.tls,
+                workers=args.workers,
+                processes=args.processes,
+            )
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(_format_row(result))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
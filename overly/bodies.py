@@ -0,0 +1,216 @@
+__all__ = ["Body", "RepeatingBody", "RandomBody", "FileBody", "RequestBody"]
+
+import os
+import mmap
+import random
+import tempfile
+from abc import ABC, abstractmethod
+
+
+class Body(ABC):
+    """
+    A response body source for the send steps. Bodies know their size up
+    front, and can be iterated over any number of times, yielding chunks.
+    """
+
+    def __init__(self, size: int, chunk_size: int = 65536):
+        self.size = size
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        return self.size
+
+    @abstractmethod
+    def __iter__(self):
+        ...
+
+    @abstractmethod
+    def slice(self, start: int, end: int) -> "Body":
+        """
+        The body from start to end, without copying any of it.
+        """
+
+
+class RepeatingBody(Body):
+    """
+    size bytes of pattern repeated, without ever holding more than about
+    a chunk of it in memory.
+
+        partial(send_404, data=RepeatingBody(8 * 1024 ** 3))
+    """
+
+    def __init__(self, size: int, pattern: bytes = b"x", chunk_size: int = 65536):
+        if not pattern:
+            raise ValueError("RepeatingBody's pattern can't be empty.")
+        super().__init__(size, chunk_size)
+        self.pattern = pattern
+
+        # Whole patterns only, so every chunk starts at the start of one.
+        repeats = -(-chunk_size // len(pattern))
+        self.buffer = memoryview(pattern * repeats)
+
+    def slice(self, start: int, end: int) -> "RepeatingBody":
+        offset = start % len(self.pattern)
+        pattern = self.pattern[offset:] + self.pattern[:offset]
+        return RepeatingBody(end - start, pattern, self.chunk_size)
+
+    def __iter__(self):
+        buffer = self.buffer
+        buffer_size = len(buffer)
+
+        remaining = self.size
+        while remaining >= buffer_size:
+            yield buffer
+            remaining -= buffer_size
+        if remaining:
+            yield buffer[:remaining]
+
+
+class RandomBody(Body):
+    """
+    size bytes of seeded pseudo random noise. The noise is generated once in
+    a pool of pool_size bytes, which the body cycles through, so the same
+    seed always gives the same body.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        seed: int = 0,
+        pool_size: int = 1024 ** 2,
+        chunk_size: int = 65536,
+    ):
+        super().__init__(size, chunk_size)
+        self.seed = seed
+        self.start = 0
+
+        pool_size = min(pool_size, max(size, 1))
+        noise = random.Random(seed).getrandbits(pool_size * 8)
+        self.pool = memoryview(noise.to_bytes(pool_size, "little"))
+
+    def slice(self, start: int, end: int) -> "RandomBody":
+        # Shares our pool, rather than generating it again.
+        body = RandomBody.__new__(RandomBody)
+        Body.__init__(body, end - start, self.chunk_size)
+        body.seed = self.seed
+        body.start = (self.start + start) % len(self.pool)
+        body.pool = self.pool
+        return body
+
+    def __iter__(self):
+        pool = self.pool
+        pool_size = len(pool)
+
+        remaining = self.size
+        offset = self.start
+        while remaining:
+            chunk = pool[offset : offset + min(self.chunk_size, remaining)]
+            yield chunk
+            remaining -= len(chunk)
+            offset = (offset + len(chunk)) % pool_size
+
+
+class FileBody(Body):
+    """
+    size bytes of the file at path, from offset. Handlers send it with
+    os.sendfile where they can, and read it through mmap where they can't.
+    """
+
+    def __init__(
+        self, path, offset: int = 0, size: int = None, chunk_size: int = 65536
+    ):
+        if size is None:
+            size = os.path.getsize(path) - offset
+        super().__init__(size, chunk_size)
+        self.path = path
+        self.offset = offset
+
+        import mimetypes
+
+        self.content_type = (
+            mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+        )
+
+    def slice(self, start: int, end: int) -> "FileBody":
+        return FileBody(self.path, self.offset + start, end - start, self.chunk_size)
+
+    def open(self):
+        return open(self.path, "rb")
+
+    def __iter__(self):
+        # The file is mapped a window at a time, so only about a window's worth
+        # of it is ever resident on our account. Chunks are views of the map,
+        # not copies.
+        window_size = max(self.chunk_size, 8 * 1024 ** 2)
+        window_size -= window_size % mmap.ALLOCATIONGRANULARITY
+
+        end = self.offset + self.size
+        position = self.offset
+        with self.open() as f:
+            while position < end:
+                window_start = position - position % mmap.ALLOCATIONGRANULARITY
+                length = min(window_size, end - window_start)
+                m = mmap.mmap(
+                    f.fileno(), length, access=mmap.ACCESS_READ, offset=window_start
+                )
+                view = memoryview(m)
+                try:
+                    while position < window_start + length:
+                        start = position - window_start
+                        chunk = view[start : min(start + self.chunk_size, length)]
+                        position += len(chunk)
+                        yield chunk
+                        del chunk
+                finally:
+                    _close_map(m, view)
+
+
+def _close_map(m: mmap.mmap, view: memoryview) -> None:
+    """
+    Unmap m once we're done with it. Chunks handed out may still be held,
+    in which case the map can't be closed yet, and is left to be unmapped
+    once they're let go of.
+    """
+    view.release()
+    try:
+        m.close()
+    except BufferError:
+        ...
+
+
+class RequestBody:
+    """
+    Collects a request body as it arrives. It's kept in memory until it
+    grows past spill_size bytes, and in a temporary file from then on.
+    """
+
+    def __init__(self, spill_size: int = 1024 ** 2):
+        self.file = tempfile.SpooledTemporaryFile(max_size=spill_size)
+        self.size = 0
+        self.value = b""
+
+    def __len__(self) -> int:
+        return self.size
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.size += len(data)
+        self.value = None
+
+    def getvalue(self) -> bytes:
+        """
+        The whole body, read in to memory.
+        """
+        if self.value is None:
+            self.value = self.open().read()
+        return self.value
+
+    def open(self):
+        """
+        The body as a file-like object, from the start.
+        """
+        self.file.seek(0)
+        return self.file
+
+    def close(self) -> None:
+        self.file.close()
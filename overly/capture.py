@@ -0,0 +1,103 @@
+from collections import deque
+
+from .constants import HttpMethods
+
+
+class CapturedRequest:
+    """
+    What a server kept of a request it received.
+
+    method, target and path are strs, headers are h11's (name, value) bytes
+    pairs. The body itself isn't kept, just its size and a 16 byte blake2b
+    body_digest. started_at is the time.time() the client handler began,
+    and receive_time how many seconds it took to read the request.
+    connection_id is shared by requests made on the same connection.
+    """
+
+    __slots__ = (
+        "method",
+        "target",
+        "headers",
+        "body_size",
+        "body_digest",
+        "connection_id",
+        "started_at",
+        "receive_time",
+    )
+
+    def __init__(
+        self,
+        method: str,
+        target: str,
+        headers: tuple,
+        body_size: int,
+        body_digest: bytes,
+        connection_id: int,
+        started_at: float,
+        receive_time: float,
+    ):
+        self.method = method
+        self.target = target
+        self.headers = headers
+        self.body_size = body_size
+        self.body_digest = body_digest
+        self.connection_id = connection_id
+        self.started_at = started_at
+        self.receive_time = receive_time
+
+    def __repr__(self):
+        return "<CapturedRequest {} {} connection {}>".format(
+            self.method, self.target, self.connection_id
+        )
+
+    @property
+    def path(self) -> str:
+        return self.target.partition("?")[0]
+
+    def header(self, name: str) -> str:
+        """
+        The value of the first header called name, or None.
+        """
+        name = name.lower().encode()
+        return next(
+            (value.decode("latin1") for key, value in self.headers if key == name),
+            None,
+        )
+
+
+class RequestCapture:
+    """
+    A ring buffer of the last capacity requests a server received, so its
+    memory use stays the same however long it runs.
+    """
+
+    def __init__(self, capacity: int):
+        self.requests = deque(maxlen=capacity)
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def __iter__(self):
+        return iter(list(self.requests))
+
+    def append(self, request: CapturedRequest) -> None:
+        self.requests.append(request)
+
+    def clear(self) -> None:
+        self.requests.clear()
+
+    def query(self, method=None, path=None, connection_id=None) -> [CapturedRequest]:
+        """
+        The captured requests matching all of the given criteria, oldest
+        first. method may be a str or HttpMethods, and path is matched
+        without the query string.
+        """
+        if isinstance(method, HttpMethods):
+            method = method.value
+        return [
+            request
+            for request in self
+            if (method is None or request.method == method)
+            and (path is None or request.path == path)
+            and (connection_id is None or request.connection_id == connection_id)
+        ]
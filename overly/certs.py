@@ -0,0 +1,231 @@
+__all__ = ["CertificateAuthority"]
+
+import os
+import re
+import tempfile
+import datetime
+import ipaddress
+from threading import Lock
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+except ImportError:
+    x509 = None
+
+from .constants import root_cert, ca_root_key
+from .socket_utils import new_server_ssl_context
+
+from .errors import logger
+
+
+_DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "overly-certs")
+
+# Leaf certs are remade when they've less than this left to run.
+_RENEW_BEFORE = datetime.timedelta(days=30)
+_VALID_FOR = datetime.timedelta(days=365)
+
+# What we'll put in a file name. SNI names are DNS names anyway.
+_HOSTNAME = re.compile(r"^[a-z0-9_-]+(\.[a-z0-9_-]+)*$")
+
+
+class CertificateAuthority:
+    """
+    Serves a cert for whichever hostname a client asks for with SNI, made
+    on first use and signed by a CA key. By default that's overly's own,
+    so clients trusting overly.default_ssl_cert trust every cert made.
+
+    Certs are kept in memory and in cache_dir, so each is only ever made
+    once, even across processes and runs. They all share one key, so
+    minting a cert for a new hostname is just a signature.
+
+    options are those of overly.server_ssl_context, and apply for every
+    hostname. Requires cryptography, pip install overly[sni].
+    """
+
+    def __init__(
+        self,
+        ca_cert: str = root_cert,
+        ca_key: str = ca_root_key,
+        cache_dir: str = _DEFAULT_CACHE_DIR,
+        default_hostname: str = "localhost",
+        **options
+    ):
+        if x509 is None:
+            raise ImportError(
+                "CertificateAuthority requires cryptography, "
+                "pip install overly[sni]"
+            )
+        self.ca_cert = x509.load_pem_x509_certificate(ca_cert.encode())
+        self.ca_key = serialization.load_pem_private_key(ca_key.encode(), None)
+        self.default_hostname = default_hostname
+
+        # Each CA gets its own directory, so certs from one are never
+        # served for another.
+        fingerprint = self.ca_cert.fingerprint(hashes.SHA256()).hex()[:16]
+        self.cache_dir = os.path.join(cache_dir, fingerprint)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.leaf_key = self.load_leaf_key()
+        self.leaf_key_pem = self.leaf_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+
+        self.context_options = options
+        self.contexts = {}
+        self.lock = Lock()
+
+    def ssl_context(self):
+        """
+        An SSLContext which picks the cert by SNI, for an AsyncServer's
+        ssl_context or partialed in to ssl_socket_wrapper. Clients not
+        using SNI get default_hostname's cert.
+        """
+        context = self.context_for(self.default_hostname)
+        context.sni_callback = self.sni_callback
+        return context
+
+    def sni_callback(self, ssl_object, server_name, context):
+        if server_name is None:
+            return
+        try:
+            ssl_object.context = self.context_for(server_name)
+        except ValueError as e:
+            logger.debug("Not serving a cert for %r: %s", server_name, e)
+
+    def context_for(self, hostname: str):
+        """
+        The SSLContext serving hostname's cert, made the first time it's
+        asked for.
+        """
+        hostname = hostname.lower()
+        context = self.contexts.get(hostname)
+        if context is not None:
+            return context
+        with self.lock:
+            context = self.contexts.get(hostname)
+            if context is None:
+                context = self.contexts[hostname] = new_server_ssl_context(
+                    self.cert_path(hostname), **self.context_options
+                )
+        return context
+
+    def cert_path(self, hostname: str) -> str:
+        """
+        The path to a file holding hostname's cert and its key, making
+        the cert if there isn't one or it's about to run out.
+        """
+        if not _HOSTNAME.match(hostname):
+            raise ValueError("Unlikely hostname: {!r}".format(hostname))
+        path = os.path.join(self.cache_dir, hostname + ".pem")
+        try:
+            with open(path, "rb") as f:
+                cert = x509.load_pem_x509_certificate(f.read())
+        except (OSError, ValueError):
+            ...
+        else:
+            if (
+                cert.public_key().public_numbers()
+                == self.leaf_key.public_key().public_numbers()
+                and _not_valid_after(cert) - _RENEW_BEFORE > _utcnow()
+            ):
+                return path
+
+        logger.debug("Making a cert for %s", hostname)
+        cert = self.make_cert(hostname)
+        _write_atomically(
+            path, cert.public_bytes(serialization.Encoding.PEM) + self.leaf_key_pem
+        )
+        return path
+
+    def make_cert(self, hostname: str):
+        try:
+            alt_name = x509.IPAddress(ipaddress.ip_address(hostname))
+        except ValueError:
+            alt_name = x509.DNSName(hostname)
+
+        now = _utcnow()
+        ca_public_key = self.ca_key.public_key()
+        return (
+            x509.CertificateBuilder()
+            .subject_name(
+                x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+            )
+            .issuer_name(self.ca_cert.subject)
+            .public_key(self.leaf_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + _VALID_FOR)
+            .add_extension(x509.SubjectAlternativeName([alt_name]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), True)
+            .add_extension(
+                x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]),
+                critical=False,
+            )
+            .add_extension(
+                x509.SubjectKeyIdentifier.from_public_key(self.leaf_key.public_key()),
+                critical=False,
+            )
+            .add_extension(
+                x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_public_key),
+                critical=False,
+            )
+            .sign(self.ca_key, hashes.SHA256())
+        )
+
+    def load_leaf_key(self):
+        """
+        The key every cert is made for, shared by everything using
+        cache_dir, and made by whichever gets there first.
+        """
+        path = os.path.join(self.cache_dir, "leaf_key.pem")
+        try:
+            with open(path, "rb") as f:
+                return serialization.load_pem_private_key(f.read(), None)
+        except FileNotFoundError:
+            ...
+
+        key = ec.generate_private_key(ec.SECP256R1())
+        key_pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        temp_path = _write_temp(self.cache_dir, key_pem)
+        try:
+            # Unlike a rename, linking won't replace a key someone else
+            # just made.
+            os.link(temp_path, path)
+        except FileExistsError:
+            with open(path, "rb") as f:
+                return serialization.load_pem_private_key(f.read(), None)
+        finally:
+            os.unlink(temp_path)
+        return key
+
+
+def _write_temp(directory: str, data: bytes) -> str:
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return temp_path
+
+
+def _write_atomically(path: str, data: bytes) -> None:
+    os.replace(_write_temp(os.path.dirname(path), data), path)
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _not_valid_after(cert):
+    try:
+        return cert.not_valid_after_utc
+    except AttributeError:
+        # cryptography before 42.
+        return cert.not_valid_after.replace(tzinfo=datetime.timezone.utc)
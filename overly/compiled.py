@@ -0,0 +1,179 @@
+from functools import partial
+from collections.abc import Sequence
+
+import h11
+
+from .bodies import RequestBody
+from .handlers import BaseClientHandler
+
+
+# Bodies at least this big are kept once and sent as a write of their own,
+# rather than duplicated to send each response in one write.
+SHARED_BODY_SIZE = 64 * 1024
+
+
+def static_response(*dynamic_kwargs):
+    """
+    Mark a send step as not depending on the request, so a server may
+    serialize its response once up front. Steps given any of
+    dynamic_kwargs as keyword arguments are left alone.
+    """
+
+    def mark(func):
+        func.static_response = dynamic_kwargs
+        return func
+
+    return mark
+
+
+class CompiledStep:
+    """
+    A step whose response has been serialized ahead of time, and is written
+    straight to the client. Requests h11 would answer differently (HEAD,
+    HTTP/1.0) are passed through to the original step.
+    """
+
+    def __init__(self, step, keep_alive_response: bytes, close_response: bytes):
+        self.step = step
+        # Each is kept as the chunks to write, so the two can share a body.
+        self.keep_alive_response = [keep_alive_response]
+        self.close_response = _share_body(close_response, keep_alive_response)
+
+        try:
+            self.__name__ = step.__name__
+        except AttributeError:
+            self.__name__ = step.func.__name__
+
+    def __call__(self, client_handler):
+        request = client_handler.request
+        if (
+            request is None
+            or request.http_version != b"1.1"
+            or request.method == b"HEAD"
+            or client_handler.bandwidth_buckets()
+        ):
+            return self.step(client_handler)
+
+        if _wants_close(request):
+            chunks = self.close_response
+        else:
+            chunks = self.keep_alive_response
+        for chunk in chunks:
+            client_handler.http_send_raw(chunk)
+
+
+def compile_steps(steps, server) -> list:
+    """
+    Swap out any static send steps for compiled ones. Handles both plain
+    step lists, and lists of (HttpMethods, path) prefixed step sequences.
+    """
+    compiled = []
+    for step in steps:
+        if isinstance(step, Sequence) and step:
+            compiled.append(
+                [step[0], *(compile_step(sub_step, server) for sub_step in step[1:])]
+            )
+        else:
+            compiled.append(compile_step(step, server))
+    return compiled
+
+
+def compile_step(step, server):
+    """
+    Compile the step if it's a static send step with static arguments,
+    otherwise return it as is.
+    """
+    func, args, kwargs = step, (), {}
+    if isinstance(step, partial):
+        func, args, kwargs = step.func, step.args, step.keywords
+
+    dynamic_kwargs = getattr(func, "static_response", None)
+    if dynamic_kwargs is None:
+        return step
+    if any(kwargs.get(kwarg) is not None for kwarg in dynamic_kwargs):
+        return step
+    if not all(_is_static(arg) for arg in (*args, *kwargs.values())):
+        return step
+
+    try:
+        keep_alive_response = _record_response(step, server, b"")
+        close_response = _record_response(step, server, b"connection: close\r\n")
+    except Exception:
+        # Leave it to fail, or not, at request time as usual.
+        return step
+
+    return CompiledStep(step, keep_alive_response, close_response)
+
+
+class _ResponseRecorder(BaseClientHandler):
+    """
+    Stands in for a client handler, serializing whatever a step sends
+    in reply to a plain GET.
+    """
+
+    def __init__(self, server, request_headers: bytes):
+        self.server = server
+        self.http_test_url = server.http_test_url
+        self.https_test_url = server.https_test_url
+
+        self.conn = h11.Connection(our_role=h11.SERVER)
+        self.conn.receive_data(
+            b"GET / HTTP/1.1\r\nhost: overly\r\n" + request_headers + b"\r\n"
+        )
+        self.request = self.conn.next_event()
+        self.conn.next_event()
+        self.request_body_buffer = RequestBody()
+        self.multipart = None
+
+        self.raw_response_sent = False
+        self.throttle = None
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    def bandwidth_buckets(self) -> list:
+        return []
+
+
+def _record_response(step, server, request_headers: bytes) -> bytes:
+    recorder = _ResponseRecorder(server, request_headers)
+    step(recorder)
+
+    # The response must be complete, as nothing else gets to go out with
+    # it: ending it should put nothing more on the wire.
+    if recorder.conn.send(h11.EndOfMessage()):
+        raise ValueError("Response isn't complete.")
+
+    return bytes(recorder.data)
+
+
+def _share_body(response: bytes, other: bytes) -> list:
+    """
+    response as chunks to write, reusing other where they're the same, or
+    other's body where only their heads differ, so that a big body is only
+    kept once however many ways it's sent.
+    """
+    if response == other:
+        return [other]
+    head_end = response.find(b"\r\n\r\n") + 4
+    other_head_end = other.find(b"\r\n\r\n") + 4
+    body = memoryview(other)[other_head_end:]
+    if len(body) >= SHARED_BODY_SIZE and memoryview(response)[head_end:] == body:
+        return [response[:head_end], body]
+    return [response]
+
+
+def _wants_close(request) -> bool:
+    return any(
+        header == b"connection" and b"close" in value.lower()
+        for header, value in request.headers
+    )
+
+
+def _is_static(value) -> bool:
+    if value is None or isinstance(value, (bytes, str, int, float)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_static(item) for item in value)
+    return False
@@ -1,8 +1,10 @@
 import logging
 
 
-logging.basicConfig(level=logging.INFO)
+# Silent unless the application configures logging, or calls
+# overly.enable_logging. With nothing enabled a log call costs a level check.
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 
 class OverlyBaseError(Exception):
@@ -0,0 +1,221 @@
+import time
+import hashlib
+import logging
+from time import perf_counter
+
+import h11
+
+from .bodies import FileBody, RequestBody
+from .capture import CapturedRequest
+from .errors import MalformedStepError, StepError
+
+from .errors import logger
+from .http_utils import MultipartStream, get_content_type
+
+
+class BaseClientHandler:
+    """
+    Step handling shared by the threaded and asyncio client handlers.
+    """
+
+    @property
+    def request_body(self) -> bytes:
+        """
+        The request body in full. Large bodies are spilled to disk as they
+        arrive, so prefer request_body_file for those.
+        """
+        return self.request_body_buffer.getvalue()
+
+    @request_body.setter
+    def request_body(self, data: bytes):
+        self.request_body_buffer.close()
+        self.request_body_buffer = RequestBody(self.server.request_body_spill_size)
+        self.request_body_buffer.write(data)
+
+    @property
+    def request_body_file(self):
+        """
+        The request body as a file-like object.
+        """
+        return self.request_body_buffer.open()
+
+    def start_request_body(self, request: h11.Request):
+        """
+        Get ready to collect the body of request. Multipart bodies are
+        parsed as they arrive, in to self.multipart.
+        """
+        content_type = get_content_type(request.headers)
+        if content_type is not None and content_type.startswith(
+            b"multipart/form-data"
+        ):
+            try:
+                self.multipart = MultipartStream(
+                    content_type,
+                    self.server.multipart_files,
+                    self.server.request_body_spill_size,
+                )
+            except ValueError:
+                logger.warning("Couldn't parse content-type %s", content_type)
+
+        self.body_size = 0
+        self.body_hash = None
+        if self.server.captures is not None:
+            self.body_hash = hashlib.blake2b(digest_size=16)
+
+    def receive_body_data(self, data: bytes):
+        self.body_size += len(data)
+        if self.body_hash is not None:
+            self.body_hash.update(data)
+
+        if self.multipart is None:
+            self.request_body_buffer.write(data)
+            return
+        self.multipart.feed(data)
+        if self.multipart.files != "summary":
+            self.request_body_buffer.write(data)
+
+    def close_request_body(self) -> None:
+        """
+        Let go of the request body and any multipart parts, deleting any
+        spilled to disk, once the response is done with.
+        """
+        self.request_body_buffer.close()
+        if self.multipart is not None:
+            self.multipart.close()
+
+    def capture_request(self) -> CapturedRequest:
+        """
+        A compact record of the request received, for the server's capture.
+        """
+        return CapturedRequest(
+            self.request.method.decode(),
+            self.request.target.decode(),
+            tuple(self.request.headers),
+            self.body_size,
+            self.body_hash.digest() if self.body_hash is not None else None,
+            self.connection_id,
+            self.started_at,
+            time.time() - self.started_at,
+        )
+
+    def detect_keepalive(self) -> bool:
+        """
+        Figure out if the client has requested a keep-alive connection.
+        """
+        return next(
+            (
+                True
+                for header, value in self.request.headers
+                if (header, value) == (b"connection", b"keep-alive")
+            ),
+            False,
+        )
+
+    def get_steps(self):
+        """
+        If there is a router, pull the steps for the current request from
+        it. Steps are routed by tuple(HttpMethod, path).
+
+        Sets self.steps equal to the found steps.
+
+        If there is no router, do nothing.
+        """
+        if self.router is not None:
+            steps = self.router.match(self.request.method, self.request.target)
+
+            if steps is None:
+                self.close()
+                raise MalformedStepError(
+                    "Couldn't find matching step "
+                    "for metohd {} at target {}".format(
+                        self.request.method.decode(), self.request.target.decode()
+                    )
+                )
+            self.steps = steps
+
+    def http_send(self, *events):
+        for event in events:
+            if self.raw_response_sent:
+                # h11 didn't see the response go out, so don't involve it further.
+                # Ending the response puts nothing more on the wire anyway.
+                if isinstance(event, (h11.EndOfMessage, h11.ConnectionClosed)):
+                    continue
+                raise StepError(
+                    "Can't send {} after a precompiled response.".format(
+                        type(event).__name__
+                    )
+                )
+            if isinstance(event, h11.Data) and len(event.data) >= 8192:
+                # Big body chunks go out as they are, rather than being copied
+                # in to h11's output first.
+                for data in self.conn.send_with_data_passthrough(event):
+                    self.write(data)
+                continue
+            data = self.conn.send(event)
+            if data is not None:
+                self.write(data)
+
+    def http_send_chunks(self, chunks):
+        """
+        Send each of an iterable of bytes as body data.
+        """
+        for chunk in chunks:
+            self.http_send(h11.Data(data=chunk))
+
+    def http_sendfile(self, body: FileBody):
+        """
+        Send a FileBody as the rest of the response body.
+        """
+        self.http_send_chunks(body)
+
+    def bandwidth_buckets(self) -> list:
+        """
+        The token buckets limiting this connection's bandwidth, if any.
+        """
+        return [
+            bucket
+            for bucket in (self.throttle, self.server.bandwidth)
+            if bucket is not None
+        ]
+
+    def http_send_raw(self, data: bytes):
+        """
+        Send an already serialized, complete response, bypassing h11.
+        """
+        self.write(data)
+        self.raw_response_sent = True
+
+    def run_step(self, step):
+        """
+        Run a step, timing it for the server's metrics and hooks.
+        """
+        started = self.step_started(step)
+        try:
+            return step(self)
+        finally:
+            self.step_finished(step, started)
+
+    def step_started(self, step) -> float:
+        self._log_step(step)
+        if self.hooks is not None:
+            self.hooks.before_step(self, step)
+        return perf_counter()
+
+    def step_finished(self, step, started: float):
+        seconds = perf_counter() - started
+        if self.server.metrics is not None:
+            self.server.metrics.record_step(self._step_name(step), seconds)
+        if self.hooks is not None:
+            self.hooks.after_step(self, step, seconds)
+
+    @staticmethod
+    def _step_name(step) -> str:
+        try:
+            return step.__name__
+        except AttributeError:
+            return step.func.__name__
+
+    @classmethod
+    def _log_step(cls, step):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Step: %s", cls._step_name(step))
@@ -0,0 +1,48 @@
+from itertools import count
+
+
+class Hooks:
+    """
+    Subclass and pass to Server as hooks to be called as it goes, for
+    profiling and tracing. Every method does nothing unless overridden.
+
+    on_connection and on_close are called for every connection. The request
+    hooks are called for 1 in every sample requests, and for all the steps
+    of the requests they are called for. They're called from whichever
+    thread, or with processes=N process, is handling the client.
+    """
+
+    def __init__(self, sample: int = 1):
+        self.sample = sample
+        self.requests = count()
+
+    def sampled(self) -> bool:
+        """
+        Whether to call the request hooks for the next request.
+        """
+        return next(self.requests) % self.sample == 0
+
+    def on_connection(self, server, connection_id: int):
+        """
+        A client connected.
+        """
+
+    def on_request_parsed(self, client_handler):
+        """
+        A request was received, and is on client_handler.request.
+        """
+
+    def before_step(self, client_handler, step):
+        """
+        step is about to be run.
+        """
+
+    def after_step(self, client_handler, step, seconds: float):
+        """
+        step has been run, taking seconds, or raised.
+        """
+
+    def on_close(self, server, connection_id: int):
+        """
+        A client's connection was closed.
+        """
@@ -3,21 +3,30 @@ __all__ = [
     "extract_query",
     "extract_form_urlencoded",
     "create_content_len_header",
+    "get_header",
+    "parse_range",
     "extract_cookies",
     "cookies_to_headers",
     "cookies_to_output",
     "parse_multipart",
+    "MultipartStream",
     "extract_multipart_form_file",
     "extract_multipart_form_data",
     "extract_multipart_json",
 ]
 
+import hashlib
 from io import BytesIO
-from json import loads
-from http.cookies import SimpleCookie
+from typing import TYPE_CHECKING
+from wsgiref.headers import Headers
 
-from sansio_multipart import MultipartParser, Part, PartData, Events
+# json, http.cookies and sansio_multipart are imported where they're used,
+# as most requests need none of them and importing overly should be quick.
+if TYPE_CHECKING:
+    from http.cookies import SimpleCookie
+    from sansio_multipart import Part
 
+from .bodies import RequestBody
 from .errors import EndSteps
 
 
@@ -60,16 +69,19 @@ def extract_cookies(client_headers):
     cookies = [f'{k}="{v}"' if " " in v else f"{k}={v}" for k, v in cookies]
 
     joined_cookies = ";".join(cookies)
+
+    from http.cookies import SimpleCookie
+
     return SimpleCookie(joined_cookies)
 
 
-def cookies_to_output(cookies: SimpleCookie) -> [[str, str]]:
+def cookies_to_output(cookies: "SimpleCookie") -> [[str, str]]:
     return [
         f"{cookie_name}={cookies[cookie_name].coded_value}" for cookie_name in cookies
     ]
 
 
-def cookies_to_headers(cookies: SimpleCookie) -> [(str, str)]:
+def cookies_to_headers(cookies: "SimpleCookie") -> [(str, str)]:
     return [("set-cookie", cookie) for cookie in cookies_to_output(cookies)]
 
 
@@ -79,7 +91,50 @@ def create_content_len_header(body: bytes) -> (str, str):
     return ("content-length", str(len(body)).encode())
 
 
-def parse_multipart(content_type: bytes, body: bytes) -> [Part]:
+def get_header(headers: [(bytes, bytes)], name: bytes) -> bytes:
+    return next((v for k, v in headers if k == name), None)
+
+
+def parse_range(range_header: bytes, size: int) -> [(int, int)]:
+    """
+    Parse a Range header in to a list of (start, end) byte offsets, end
+    exclusive, for a body of the given size.
+
+    Returns None if the header is malformed or not in bytes, in which case
+    it should be ignored, and an empty list if none of the ranges can be
+    satisfied.
+    """
+    unit, _, range_set = range_header.decode("latin-1").partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+
+    ranges = []
+    for spec in range_set.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                # Suffix range, the last n bytes.
+                length = int(last)
+                if length:
+                    ranges.append((max(size - length, 0), size))
+                continue
+
+            start = int(first)
+            end = int(last) + 1 if last else size
+        except ValueError:
+            return None
+        if last and end <= start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+
+    return [(start, end) for start, end in ranges if start < end]
+
+
+def parse_multipart(content_type: bytes, body: bytes) -> ["Part"]:
+    from sansio_multipart import MultipartParser, Part, PartData, Events
 
     content_type, boundary = content_type.split(b";")
     boundary = boundary.lstrip()
@@ -105,20 +160,206 @@ def parse_multipart(content_type: bytes, body: bytes) -> [Part]:
     return parts
 
 
-def extract_multipart_form_file(part: Part) -> dict:
+class MultipartStream:
+    """
+    Parses a multipart/form-data body as it arrives, a chunk at a time.
+
+    Form fields are always kept in memory. What happens to file parts is
+    decided by files:
+        "memory", kept in memory.
+        "disk", kept in temporary files once they grow past spill_size.
+        "summary", only their size and sha256 are kept.
+    """
+
+    def __init__(self, content_type: bytes, files="memory", spill_size=1024 ** 2):
+        if files not in ("memory", "disk", "summary"):
+            raise ValueError("files must be one of memory, disk or summary.")
+        boundary = _multipart_boundary(content_type)
+        self.delimiter = b"--" + boundary
+        # Bodies end where a delimiter starts, on a line of its own.
+        self.body_end = b"\r\n--" + boundary
+        self.files = files
+        self.spill_size = spill_size
+
+        self.buffer = bytearray()
+        self.state = "preamble"
+        self.parts = []
+        self.current_part = None
+        self.finished = False
+
+    def feed(self, data: bytes) -> None:
+        # sansio_multipart's MultipartParser drops bytes where chunks
+        # split lines, so the body is scanned for boundaries here instead.
+        if self.finished:
+            return
+        self.buffer += data
+        while not self.finished and self._parse():
+            ...
+
+    def _parse(self) -> bool:
+        """
+        Make what progress the buffer allows, returning whether to go on.
+        """
+        buffer = self.buffer
+        if self.state == "preamble":
+            index = buffer.find(self.delimiter)
+            if index == -1:
+                del buffer[: max(len(buffer) - len(self.delimiter), 0)]
+                return False
+            del buffer[: index + len(self.delimiter)]
+            self.state = "delimiter"
+
+        elif self.state == "delimiter":
+            # The rest of a delimiter line. -- after it ends the body.
+            if buffer.startswith(b"--"):
+                self.finished = True
+                return False
+            index = buffer.find(b"\r\n")
+            if index == -1:
+                return False
+            del buffer[: index + 2]
+            self.state = "headers"
+
+        elif self.state == "headers":
+            if buffer.startswith(b"\r\n"):
+                header_block, index = b"", 2
+            else:
+                index = buffer.find(b"\r\n\r\n")
+                if index == -1:
+                    return False
+                header_block, index = bytes(buffer[:index]), index + 4
+            del buffer[:index]
+            self.current_part = MultipartPart(
+                _parse_part_headers(header_block), self.files, self.spill_size
+            )
+            self.parts.append(self.current_part)
+            self.state = "body"
+
+        elif self.state == "body":
+            index = buffer.find(self.body_end)
+            if index == -1:
+                # Hold back what could be the start of the delimiter.
+                keep = len(self.body_end) - 1
+                if len(buffer) > keep:
+                    self.current_part.write(bytes(buffer[:-keep]))
+                    del buffer[:-keep]
+                return False
+            self.current_part.write(bytes(buffer[:index]))
+            del buffer[: index + len(self.body_end)]
+            self.state = "delimiter"
+
+        return True
+
+    def close(self) -> None:
+        for part in self.parts:
+            part.close()
+
+
+class MultipartPart:
+    """
+    A part of a multipart/form-data body, as collected by MultipartStream.
+    Has the same attributes as sansio_multipart's Part, as far as the
+    extract_multipart_* funcs are concerned.
+    """
+
+    def __init__(self, headers: Headers, files="memory", spill_size=1024 ** 2):
+        from sansio_multipart.utils import parse_options_header
+
+        self.headers = headers
+        _, options = parse_options_header(
+            headers.get("content-disposition", "")
+        )
+        self.name = options.get("name")
+        self.filename = options.get("filename")
+        self.content_type, options = parse_options_header(
+            headers.get("content-type", "")
+        )
+        self.charset = options.get("charset") or "latin1"
+        self.size = 0
+        self.hash = None
+        self.data = bytearray()
+        if self.filename and files == "disk":
+            self.data = RequestBody(spill_size)
+        elif self.filename and files == "summary":
+            self.hash = hashlib.sha256()
+            self.data = None
+
+    @property
+    def summarized(self) -> bool:
+        return self.data is None
+
+    @property
+    def sha256(self) -> str:
+        return self.hash.hexdigest() if self.hash is not None else None
+
+    @property
+    def raw(self) -> bytes:
+        if self.data is None:
+            raise ValueError("Part {} was summarized, not kept.".format(self.name))
+        if isinstance(self.data, RequestBody):
+            return self.data.getvalue()
+        return bytes(self.data)
+
+    @property
+    def value(self) -> str:
+        return self.raw.decode(self.charset)
+
+    def open(self):
+        """
+        The part's data as a file-like object, from the start.
+        """
+        if isinstance(self.data, RequestBody):
+            return self.data.open()
+        return BytesIO(self.raw)
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.hash is not None:
+            self.hash.update(data)
+        elif isinstance(self.data, RequestBody):
+            self.data.write(data)
+        else:
+            self.data += data
+
+    def close(self) -> None:
+        if isinstance(self.data, RequestBody):
+            self.data.close()
+
+
+def _multipart_boundary(content_type: bytes) -> bytes:
+    for param in content_type.split(b";")[1:]:
+        key, _, value = param.strip().partition(b"=")
+        if key.strip().lower() == b"boundary":
+            return value.strip().strip(b'"')
+    raise ValueError("No boundary in multipart content-type.")
+
+
+def _parse_part_headers(header_block: bytes) -> Headers:
+    headers = []
+    for line in header_block.decode("latin1").split("\r\n"):
+        name, colon, value = line.partition(":")
+        if colon:
+            headers.append((name.strip(), value.strip()))
+    return Headers(headers)
+
+
+def extract_multipart_form_file(part: "Part") -> dict:
     file_data = {
         "name": part.name,
         "filename": part.filename,
         "content-type": part.content_type,
         "charset": part.charset,
         "content-length": part.size,
-        "file": part.value,
     }
+    if getattr(part, "summarized", False):
+        file_data["sha256"] = part.sha256
+    else:
+        file_data["file"] = part.value
 
     return file_data
 
 
-def extract_multipart_form_data(part: Part) -> dict:
+def extract_multipart_form_data(part: "Part") -> dict:
     form_data = {
         "name": part.name,
         "content-type": part.content_type,
@@ -130,7 +371,9 @@ def extract_multipart_form_data(part: Part) -> dict:
     return form_data
 
 
-def extract_multipart_json(part: Part) -> dict:
+def extract_multipart_json(part: "Part") -> dict:
+    from json import loads
+
     json = {
         "name": part.name,
         "content-type": part.content_type,
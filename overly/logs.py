@@ -0,0 +1,71 @@
+import logging
+from queue import Queue
+from logging.handlers import QueueHandler, QueueListener
+
+from .errors import logger
+
+
+__all__ = ["enable_logging", "disable_logging"]
+
+
+DEFAULT_FORMAT = "%(asctime)s %(processName)s %(threadName)s %(levelname)s %(message)s"
+
+_listener = None
+
+
+def enable_logging(level=logging.INFO, *handlers: logging.Handler) -> QueueListener:
+    """
+    Turn on overly's logging, which is off unless your own logging config
+    says otherwise. DEBUG logs every request and step.
+
+    Records are put on a queue and written by handlers, stderr by default,
+    in a background thread, so client handlers don't wait on the writes.
+    The listener doing the writing is returned.
+    """
+    global _listener
+    disable_logging()
+
+    if not handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+        handlers = (handler,)
+
+    log_queue = Queue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+    # Ours alone, or anything the root logger has would write them too,
+    # in the client handler's thread.
+    logger.propagate = False
+    _listener.start()
+    return _listener
+
+
+def disable_logging() -> None:
+    """
+    Undo enable_logging, writing out any records still queued.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+    logger.propagate = True
+    _listener = None
+
+
+def restart_after_fork() -> None:
+    """
+    The listener's thread doesn't survive a fork, so a forked child
+    needs its own to write what it logs.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener = QueueListener(
+        _listener.queue, *_listener.handlers, respect_handler_level=True
+    )
+    _listener.start()
@@ -0,0 +1,384 @@
+import sys
+import struct
+import socket
+from collections import deque
+from threading import Lock, Thread
+
+
+# Recording is an append to a deque, which is atomic, so the threads
+# handling clients never wait on a lock. Appended values are folded in
+# to totals when read, or once this many have piled up.
+_COLLECT_AT = 4096
+
+
+class Counter:
+    """
+    A running total which any thread may add to without locking.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.total = 0
+        self.lock = Lock()
+
+    def add(self, n: int = 1) -> None:
+        self.pending.append(n)
+        if len(self.pending) > _COLLECT_AT:
+            self.collect(blocking=False)
+
+    def collect(self, blocking=True) -> None:
+        if not self.lock.acquire(blocking):
+            # Someone else is already on it.
+            return
+        try:
+            pending = self.pending
+            total = 0
+            for _ in range(len(pending)):
+                total += pending.popleft()
+            self.total += total
+        finally:
+            self.lock.release()
+
+    @property
+    def value(self) -> int:
+        self.collect()
+        return self.total
+
+
+class Histogram(Counter):
+    """
+    An HDR style histogram of durations in seconds. Durations are kept as
+    whole microseconds in log-linear buckets, 32 to each power of two, so
+    percentiles are accurate to about 3%. Memory use depends on the range
+    of durations seen, not how many.
+    """
+
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds: float) -> None:
+        self.add(int(seconds * 1000000))
+
+    def collect(self, blocking=True) -> None:
+        if not self.lock.acquire(blocking):
+            return
+        try:
+            pending = self.pending
+            buckets = self.buckets
+            for _ in range(len(pending)):
+                micros = pending.popleft()
+                index = self.bucket_index(micros)
+                buckets[index] = buckets.get(index, 0) + 1
+                self.count += 1
+                self.sum += micros
+                if self.min is None or micros < self.min:
+                    self.min = micros
+                if self.max is None or micros > self.max:
+                    self.max = micros
+        finally:
+            self.lock.release()
+
+    @classmethod
+    def bucket_index(cls, micros: int) -> int:
+        # The top SUB_BUCKET_BITS bits after the leading one pick the bucket,
+        # so the kept bits run from 1 << SUB_BUCKET_BITS to twice that.
+        shift = micros.bit_length() - cls.SUB_BUCKET_BITS - 1
+        if shift <= 0:
+            return micros
+        return (shift << cls.SUB_BUCKET_BITS) + (micros >> shift)
+
+    @classmethod
+    def bucket_value(cls, index: int) -> int:
+        """
+        The middle of a bucket, in microseconds.
+        """
+        shift = (index >> cls.SUB_BUCKET_BITS) - 1
+        if shift <= 0:
+            return index
+        low = (index - (shift << cls.SUB_BUCKET_BITS)) << shift
+        return low + (1 << (shift - 1))
+
+    def merge(self, other: "Histogram") -> None:
+        other.collect()
+        self.collect()
+        with self.lock:
+            for index, count in other.buckets.items():
+                self.buckets[index] = self.buckets.get(index, 0) + count
+            self.count += other.count
+            self.sum += other.sum
+            if other.min is not None:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+                self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentiles(self, *percents: float) -> [float]:
+        self.collect()
+        if not self.count:
+            return [None for _ in percents]
+        with self.lock:
+            found = []
+            wanted = [self.count * percent / 100 for percent in percents]
+            seen = 0
+            for index in sorted(self.buckets):
+                seen += self.buckets[index]
+                while len(found) < len(wanted) and seen >= wanted[len(found)]:
+                    micros = self.bucket_value(index)
+                    found.append(min(max(micros, self.min), self.max) / 1000000)
+            while len(found) < len(wanted):
+                found.append(self.max / 1000000)
+        return found
+
+    def summary(self) -> dict:
+        self.collect()
+        if not self.count:
+            return {"count": 0}
+        p50, p90, p99, p999 = self.percentiles(50, 90, 99, 99.9)
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count / 1000000,
+            "min": self.min / 1000000,
+            "max": self.max / 1000000,
+            "p50": p50,
+            "p90": p90,
+            "p99": p99,
+            "p999": p999,
+        }
+
+
+class Gauge:
+    """
+    A value that goes up and down, remembering the highest it's been.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self.peak = 0
+        self.lock = Lock()
+
+    def inc(self) -> None:
+        with self.lock:
+            self.value += 1
+            if self.value > self.peak:
+                self.peak = self.value
+
+    def dec(self) -> None:
+        with self.lock:
+            self.value -= 1
+
+    def set(self, value: int) -> None:
+        with self.lock:
+            self.value = value
+            if value > self.peak:
+                self.peak = value
+
+
+class Metrics:
+    """
+    What a server has been up to. Durations are in seconds.
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.keep_alive_reuses = Counter()
+        self.bytes_in = Counter()
+        self.bytes_out = Counter()
+        self.connections = Gauge()
+        self.accept_queue = Gauge()
+        self.step_durations = {}
+
+    def record_step(self, name: str, seconds: float) -> None:
+        try:
+            histogram = self.step_durations[name]
+        except KeyError:
+            histogram = self.step_durations.setdefault(name, Histogram())
+        histogram.record(seconds)
+
+    def sample_accept_queue(self, sock: socket.socket) -> None:
+        depth = accept_queue_depth(sock)
+        if depth is not None:
+            self.accept_queue.set(depth)
+
+    def merge(self, other: "Metrics") -> None:
+        """
+        Add in the metrics of another server, like a forked child.
+        """
+        for name in ("requests", "keep_alive_reuses", "bytes_in", "bytes_out"):
+            getattr(self, name).add(getattr(other, name).value)
+        for name in ("connections", "accept_queue"):
+            gauge, other_gauge = getattr(self, name), getattr(other, name)
+            with gauge.lock:
+                gauge.peak = max(gauge.peak, other_gauge.peak)
+        for name, histogram in other.step_durations.items():
+            self.step_durations.setdefault(name, Histogram()).merge(histogram)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests.value,
+            "keep_alive_reuses": self.keep_alive_reuses.value,
+            "bytes_in": self.bytes_in.value,
+            "bytes_out": self.bytes_out.value,
+            "active_connections": self.connections.value,
+            "peak_connections": self.connections.peak,
+            "accept_queue": self.accept_queue.value,
+            "peak_accept_queue": self.accept_queue.peak,
+            "steps": {
+                name: histogram.summary()
+                for name, histogram in list(self.step_durations.items())
+            },
+        }
+
+    def __getstate__(self):
+        # Locks and pending deques don't pickle, so fold everything in first
+        # and send plain values across.
+        stats = {}
+        for name in ("requests", "keep_alive_reuses", "bytes_in", "bytes_out"):
+            stats[name] = getattr(self, name).value
+        for name in ("connections", "accept_queue"):
+            gauge = getattr(self, name)
+            stats[name] = (gauge.value, gauge.peak)
+        stats["step_durations"] = {}
+        for name, histogram in list(self.step_durations.items()):
+            histogram.collect()
+            stats["step_durations"][name] = (
+                histogram.buckets,
+                histogram.count,
+                histogram.sum,
+                histogram.min,
+                histogram.max,
+            )
+        return stats
+
+    def __setstate__(self, stats):
+        self.__init__()
+        for name in ("requests", "keep_alive_reuses", "bytes_in", "bytes_out"):
+            getattr(self, name).total = stats[name]
+        for name in ("connections", "accept_queue"):
+            gauge = getattr(self, name)
+            gauge.value, gauge.peak = stats[name]
+        for name, state in stats["step_durations"].items():
+            histogram = self.step_durations[name] = Histogram()
+            (
+                histogram.buckets,
+                histogram.count,
+                histogram.sum,
+                histogram.min,
+                histogram.max,
+            ) = state
+
+
+def accept_queue_depth(sock: socket.socket) -> int:
+    """
+    How many connections are waiting to be accepted on a listening sock.
+    Only Linux tells us, through TCP_INFO, elsewhere this is None.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 32)
+    except (OSError, AttributeError):
+        return None
+    # For listening socks tcpi_unacked is the accept queue's length.
+    return struct.unpack_from("I", info, 24)[0]
+
+
+def prometheus_text(stats: dict) -> str:
+    """
+    Render a server's stats in the Prometheus text exposition format.
+    """
+    lines = []
+
+    def metric(name, kind, value, help_text):
+        lines.append("# HELP overly_{} {}".format(name, help_text))
+        lines.append("# TYPE overly_{} {}".format(name, kind))
+        lines.append("overly_{} {}".format(name, value))
+
+    metric("requests_total", "counter", stats["requests"], "Requests received.")
+    metric(
+        "keep_alive_reuses_total",
+        "counter",
+        stats["keep_alive_reuses"],
+        "Requests made on kept alive connections.",
+    )
+    metric("received_bytes_total", "counter", stats["bytes_in"], "Bytes received.")
+    metric("sent_bytes_total", "counter", stats["bytes_out"], "Bytes sent.")
+    metric(
+        "active_connections",
+        "gauge",
+        stats["active_connections"],
+        "Connections open.",
+    )
+    metric(
+        "peak_connections", "gauge", stats["peak_connections"], "Most connections open."
+    )
+    metric(
+        "accept_queue",
+        "gauge",
+        stats["accept_queue"],
+        "Connections waiting to be accepted, when last looked at.",
+    )
+
+    lines.append("# HELP overly_step_duration_seconds Time spent running each step.")
+    lines.append("# TYPE overly_step_duration_seconds summary")
+    for name, summary in stats["steps"].items():
+        if not summary["count"]:
+            continue
+        for quantile, key in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99")):
+            lines.append(
+                'overly_step_duration_seconds{{step="{}",quantile="{}"}} {}'.format(
+                    name, quantile, summary[key]
+                )
+            )
+        lines.append(
+            'overly_step_duration_seconds_sum{{step="{}"}} {}'.format(
+                name, summary["mean"] * summary["count"]
+            )
+        )
+        lines.append(
+            'overly_step_duration_seconds_count{{step="{}"}} {}'.format(
+                name, summary["count"]
+            )
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsEndpoint:
+    """
+    Serves a server's stats for Prometheus to scrape, on a port of its own.
+    """
+
+    def __init__(self, server, location):
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        self.server = server
+
+        stats = server.stats
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = prometheus_text(stats()).encode()
+                self.send_response(200)
+                self.send_header("content-type", "text/plain; version=0.0.4")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                ...
+
+        self.http_server = HTTPServer(location, Handler)
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.http_server.shutdown()
+        self.http_server.server_close()
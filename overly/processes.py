@@ -0,0 +1,188 @@
+import time
+import multiprocessing
+from queue import Empty
+from threading import Thread
+from itertools import count
+
+from .socket_utils import reuseport_socket_factory
+from .metrics import Metrics
+
+from .errors import logger
+from .logs import restart_after_fork, disable_logging
+
+
+class ProcessGroup:
+    """
+    Runs a Server's accept / handle loop in several forked processes, all
+    bound to the server's location with SO_REUSEPORT so the kernel spreads
+    connections between them.
+
+    max_requests is shared between the processes, and every request a child
+    captures is reported back to the server in the parent.
+    """
+
+    def __init__(self, server, size: int):
+        self.server = server
+        self.size = size
+
+        # Steps may well be lambdas and partials, which can't be pickled
+        # across to a spawned process.
+        self.context = multiprocessing.get_context("fork")
+
+        self.requests_count = self.context.Value("i", 0)
+        self.captured_requests = self.context.Queue()
+        self.child_metrics = self.context.Queue()
+        self.latest_metrics = {}
+        # A plain flag rather than an Event, as children may exit while
+        # waiting on it, which leaves an Event's condition unusable.
+        self.stop = self.context.Value("b", 0)
+        self.ready = [self.context.Event() for _ in range(size)]
+
+        self.children = []
+
+    def run(self) -> None:
+        for index, ready in enumerate(self.ready):
+            child = self.context.Process(target=self.run_child, args=(index, ready))
+            child.daemon = True
+            child.start()
+            self.children.append(child)
+
+        for child, ready in zip(self.children, self.ready):
+            while not ready.wait(0.05):
+                if not child.is_alive():
+                    self.stop.value = 1
+                    raise RuntimeError(
+                        "Server process {} failed to start.".format(child.pid)
+                    )
+        self.server.ready_to_go.set()
+
+        logger.info("Listening in %s processes...", self.size)
+
+        while any(child.is_alive() for child in self.children):
+            if self.server.kill_threads:
+                self.stop.value = 1
+            self.collect_requests(timeout=0.05)
+            self.collect_metrics()
+
+        for child in self.children:
+            child.join()
+        self.collect_requests()
+        self.collect_metrics(timeout=1)
+
+        self.server.ready_to_go.clear()
+        self.server.requests_count = self.requests_count.value
+        self.server.kill_threads = True
+
+    def collect_requests(self, timeout=0) -> None:
+        """
+        Pull requests captured by the children in to the parent's server,
+        waiting up to timeout for the first.
+        """
+        if self.server.captures is None:
+            return
+        try:
+            while True:
+                self.server.captures.append(
+                    self.captured_requests.get(timeout=timeout)
+                )
+                timeout = 0
+        except Empty:
+            ...
+
+    def collect_metrics(self, timeout=0) -> None:
+        """
+        Pull the metrics the children report in to the parent's server. They
+        report every second, and on their way out, which is waited on for up
+        to timeout.
+        """
+        if self.server.metrics is None:
+            return
+        updated = False
+        try:
+            while True:
+                index, metrics = self.child_metrics.get(timeout=timeout)
+                latest = self.latest_metrics.get(index)
+                # Reports are cumulative, so keep whichever has seen the most.
+                if latest is None or metrics.requests.total >= latest.requests.total:
+                    self.latest_metrics[index] = metrics
+                    updated = True
+                if timeout and len(self.latest_metrics) == self.size:
+                    timeout = 0
+        except Empty:
+            ...
+        if updated:
+            merged = Metrics()
+            for metrics in self.latest_metrics.values():
+                merged.merge(metrics)
+            self.server.metrics = merged
+
+    def run_child(self, index, ready) -> None:
+        """
+        Runs in the forked process, turning our copy of the server in to
+        a plain single process server.
+        """
+        server = self.server
+        server.processes = None
+        server.process_group = self
+        server.socket_factory = reuseport_socket_factory(server.socket_factory)
+        # Interleaved, so connection ids are unique across the children.
+        server.connection_ids = count(index, self.size)
+        # The parent serves any metrics endpoint, from what we report.
+        server.metrics_port = None
+
+        server.metrics = Metrics() if server.metrics is not None else None
+
+        restart_after_fork()
+        Thread(target=self.watch_child, args=(index, ready), daemon=True).start()
+
+        try:
+            server.run()
+        except SystemExit as e:
+            # Silent in a thread, but a process would print it.
+            logger.info(e)
+        finally:
+            self.report_metrics(index)
+            disable_logging()
+
+    def report_metrics(self, index) -> None:
+        if self.server.metrics is not None:
+            self.child_metrics.put((index, self.server.metrics))
+
+    def watch_child(self, index, ready) -> None:
+        """
+        Tell the parent when the child is listening, and wake the child when
+        the parent wants it dead or the other children have used up the
+        remaining requests. Meanwhile, report our metrics every second.
+        """
+        server = self.server
+        server.ready_to_go.wait()
+        ready.set()
+
+        reported = time.monotonic()
+        woken = False
+        # Once the requests are used up we wake the child to finish, but keep
+        # watching, as it may be waiting on clients when the parent stops.
+        while not self.stop.value:
+            time.sleep(0.05)
+            if not woken and not server.requests_remaining():
+                if server.socket_manager is not None:
+                    server.socket_manager.wakeup()
+                woken = True
+            if time.monotonic() - reported >= 1:
+                self.report_metrics(index)
+                reported = time.monotonic()
+
+        server.kill()
+
+    def claim_request(self) -> bool:
+        with self.requests_count.get_lock():
+            if self.requests_count.value >= self.server.max_requests:
+                return False
+            self.requests_count.value += 1
+        return True
+
+    def requests_remaining(self) -> bool:
+        return self.requests_count.value < self.server.max_requests
+
+    def record_request(self, record) -> None:
+        self.captured_requests.put(record)
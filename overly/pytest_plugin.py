@@ -0,0 +1,69 @@
+"""
+pytest fixtures serving every test from one server, started once a session,
+rather than binding and tearing down a Server per test. Enable with
+``pytest -p overly.pytest_plugin``, or in a conftest.py:
+
+    pytest_plugins = ["overly.pytest_plugin"]
+
+Then mark tests with the steps to serve:
+
+    @pytest.mark.overly([send_200, finish], max_requests=1)
+    def test_thing(overly_server):
+        requests.get(overly_server.http_test_url)
+
+Marks take the same arguments as Server.install. Unmarked tests may call
+overly_server.install themselves. To pass other arguments to the server,
+override the overly_server_options fixture, and to use an AsyncServer,
+overly_server_class.
+"""
+
+import pytest
+
+from .base import Server
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "overly(steps, *, ordered_steps=False, max_requests=None): "
+        "steps for overly_server to serve the test with.",
+    )
+
+
+@pytest.fixture(scope="session")
+def overly_server_class():
+    return Server
+
+
+@pytest.fixture(scope="session")
+def overly_server_options():
+    """
+    Arguments for the session's server. location defaults to an unused
+    port on localhost.
+    """
+    return {}
+
+
+@pytest.fixture(scope="session")
+def overly_session_server(overly_server_class, overly_server_options):
+    options = dict(overly_server_options)
+    location = options.pop("location", ("localhost", 0))
+    server = overly_server_class(location, max_requests=None, steps=[], **options)
+    server.start()
+    server.ready_to_go.wait()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def overly_server(overly_session_server, request):
+    """
+    The session's server, with the test's steps installed and its counts,
+    captures and stats reset.
+    """
+    marker = request.node.get_closest_marker("overly")
+    if marker is not None:
+        overly_session_server.install(*marker.args, **marker.kwargs)
+    else:
+        overly_session_server.install([])
+    return overly_session_server
@@ -0,0 +1,143 @@
+import re
+from collections.abc import Sequence
+from urllib.parse import urlsplit
+
+from .constants import HttpMethods
+from .errors import MalformedStepError
+
+
+Pattern = type(re.compile(""))
+
+
+class Router:
+    """
+    Finds the steps for a request, from step sequences prefixed with
+    (HttpMethods, path). Built once per server rather than per request.
+
+    Paths may be:
+        exact, "/users"
+        wildcard, with * standing in for any one segment, "/users/*/posts"
+        prefix, ending in ** to match it and anything under it, "/static/**"
+        regex, a compiled re pattern which must match the whole path
+
+    Requests are matched on their path, so query strings don't get in the
+    way. Exact paths win, then wildcard and prefix paths with the most
+    specific first, then regexes in the order given.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.tries = {}
+        self.regexes = {}
+
+    @classmethod
+    def from_steps(cls, steps) -> "Router":
+        """
+        Build a router from a list of steps, or return None if none of them
+        are (HttpMethods, path) prefixed sequences.
+        """
+        router = cls()
+        for step in steps:
+            if isinstance(step, Sequence):
+                try:
+                    http_method, path = step[0]
+                    assert isinstance(http_method, HttpMethods)
+                    assert isinstance(path, (str, Pattern))
+                except (AssertionError, IndexError, ValueError, TypeError):
+                    raise MalformedStepError(
+                        "0th elem of multi step sequences "
+                        "must be formed: (HttpMethods, str)"
+                    )
+                router.add(http_method, path, step[1:])
+
+        if not (router.exact or router.tries or router.regexes):
+            return None
+        return router
+
+    def add(self, http_method: HttpMethods, path, steps) -> None:
+        method = http_method.value.encode()
+
+        if isinstance(path, Pattern):
+            self.regexes.setdefault(method, []).append((path, steps))
+            return
+
+        segments = path.split("/")
+        if "*" not in segments and "**" not in segments:
+            self.exact[(method, path)] = steps
+            return
+
+        node = self.tries.setdefault(method, _RouteNode())
+        for index, segment in enumerate(segments):
+            if segment == "**":
+                if index != len(segments) - 1:
+                    raise MalformedStepError("** may only end a path: {}".format(path))
+                node.prefix_steps = steps
+                return
+            if segment == "*":
+                if node.wildcard is None:
+                    node.wildcard = _RouteNode()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(segment, _RouteNode())
+        node.steps = steps
+
+    def match(self, method: bytes, target: bytes):
+        """
+        The steps for a request, or None if nothing matches.
+        """
+        path = _target_path(target)
+
+        steps = self.exact.get((method, path))
+        if steps is not None:
+            return steps
+
+        root = self.tries.get(method)
+        if root is not None:
+            steps = root.match(path.split("/"), 0)
+            if steps is not None:
+                return steps
+
+        for pattern, steps in self.regexes.get(method, ()):
+            if pattern.fullmatch(path):
+                return steps
+
+        return None
+
+
+class _RouteNode:
+    """
+    A path segment in a router's trie of wildcard and prefix paths.
+    """
+
+    __slots__ = ("children", "wildcard", "steps", "prefix_steps")
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.steps = None
+        self.prefix_steps = None
+
+    def match(self, segments: [str], index: int):
+        if index == len(segments):
+            if self.steps is not None:
+                return self.steps
+        else:
+            # Literal segments are tried before wildcards, backing off to
+            # the longest matching prefix.
+            child = self.children.get(segments[index])
+            if child is not None:
+                steps = child.match(segments, index + 1)
+                if steps is not None:
+                    return steps
+            if self.wildcard is not None:
+                steps = self.wildcard.match(segments, index + 1)
+                if steps is not None:
+                    return steps
+        return self.prefix_steps
+
+
+def _target_path(target: bytes) -> str:
+    if target.startswith(b"/"):
+        return target.partition(b"?")[0].partition(b"#")[0].decode()
+    # Absolute form, as sent to proxies, or * for OPTIONS.
+    return urlsplit(target).path.decode() or target.decode()
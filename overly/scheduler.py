@@ -0,0 +1,77 @@
+import time
+import heapq
+import itertools
+from threading import Thread, Condition
+
+
+class Park:
+    """
+    Returned by a step to have the client handler set aside for seconds,
+    without holding a thread, before carrying on with its steps.
+    If then is given, it's run as a step first on waking.
+    """
+
+    def __init__(self, seconds, then=None):
+        self.seconds = seconds
+        self.then = then
+
+
+class Scheduler(Thread):
+    """
+    Keeps parked client handlers in a heap by deadline, handing each to
+    resume when its time comes. The one thread waits on all of them.
+    """
+
+    def __init__(self, resume):
+        super().__init__(daemon=True)
+        self.resume = resume
+
+        self.parked = []
+        self.counter = itertools.count()
+        self.condition = Condition()
+        self.stopped = False
+
+    def park(self, client_handler, seconds) -> None:
+        deadline = time.monotonic() + seconds
+        with self.condition:
+            if self.stopped:
+                client_handler.release()
+                return
+            heapq.heappush(self.parked, (deadline, next(self.counter), client_handler))
+            if self.parked[0][2] is client_handler:
+                self.condition.notify()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    if not self.parked:
+                        self.condition.wait()
+                        continue
+                    wait = self.parked[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self.condition.wait(wait)
+                else:
+                    return
+
+                now = time.monotonic()
+                due = []
+                while self.parked and self.parked[0][0] <= now:
+                    due.append(heapq.heappop(self.parked)[2])
+
+            for client_handler in due:
+                self.resume(client_handler)
+
+    def stop(self) -> None:
+        """
+        Stop the scheduler, releasing anything still parked, and anything
+        parked after, which closes their connections.
+        """
+        with self.condition:
+            self.stopped = True
+            parked, self.parked = self.parked, []
+            self.condition.notify()
+
+        for _, _, client_handler in parked:
+            client_handler.release()
@@ -1,13 +1,26 @@
-__all__ = ["default_socket_factory", "default_socket_wrapper", "ssl_socket_wrapper"]
+__all__ = [
+    "default_socket_factory",
+    "reuseport_socket_factory",
+    "default_socket_wrapper",
+    "ssl_socket_wrapper",
+    "server_ssl_context",
+    "new_server_ssl_context",
+]
 
 import os
+import sys
 import socket
-import ssl
 
+from typing import TYPE_CHECKING
 from contextlib import closing
+from functools import lru_cache
 
 from .errors import logger
 
+# ssl is imported where it's used, as it's slow to import.
+if TYPE_CHECKING:
+    import ssl
+
 
 _HERE = os.path.dirname(__file__)
 _DEFAULT_SERVER_CERT = os.path.join(_HERE, "default_server_cert.pem")
@@ -20,19 +33,117 @@ def default_socket_factory():
     return sock
 
 
+def reuseport_socket_factory(socket_factory=default_socket_factory):
+    """
+    Wrap a socket factory so that its sockets may bind an address which
+    other processes are also bound to.
+    """
+
+    def reuseport_socket_factory_():
+        sock = socket_factory()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return sock
+
+    return reuseport_socket_factory_
+
+
 # ----------------
 # Socket wrappers
 # ----------------
 
 
+def is_tls(sock) -> bool:
+    """
+    Whether sock is an SSLSocket, without importing ssl to find out. If it
+    hasn't been imported, nothing can have made one.
+    """
+    ssl = sys.modules.get("ssl")
+    return ssl is not None and isinstance(sock, ssl.SSLSocket)
+
+
 default_socket_wrapper = closing
 
 
-def ssl_socket_wrapper(sock):
-    logger.info(f"server cert path: {_DEFAULT_SERVER_CERT} | server key path: {_DEFAULT_SERVER_KEY}")
-    return ssl.wrap_socket(
-        sock,
-        certfile=_DEFAULT_SERVER_CERT,
-        keyfile=_DEFAULT_SERVER_KEY,
-        server_side=True,
+def ssl_socket_wrapper(sock, context=None):
+    """
+    Wrap a listening sock in TLS, with server_ssl_context() unless another
+    context is given. For other certs, ciphers or protocols, partial this
+    with a context of your own.
+
+    Accepting doesn't handshake, the client handler does that, so a slow
+    client doesn't stall the accept loop.
+    """
+    if context is None:
+        context = server_ssl_context()
+    return context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+
+
+@lru_cache(maxsize=None)
+def server_ssl_context(
+    certfile=_DEFAULT_SERVER_CERT,
+    keyfile=_DEFAULT_SERVER_KEY,
+    *,
+    ciphers=None,
+    minimum_version=None,
+    maximum_version=None,
+    alpn_protocols=("http/1.1",),
+    session_tickets=True,
+) -> "ssl.SSLContext":
+    """
+    A server side SSLContext, made once for each set of arguments and
+    shared by every server using them. Also usable as an AsyncServer's
+    ssl_context.
+
+    Sharing the context shares its session cache and ticket keys, so
+    clients can resume TLS sessions across servers rather than doing a
+    full handshake every connection. session_tickets=False leaves only the
+    session cache, which TLS 1.2 clients can resume from but TLS 1.3
+    clients can't.
+
+    ciphers is an OpenSSL cipher string, minimum_version and
+    maximum_version are ssl.TLSVersions, and alpn_protocols is a tuple.
+    overly only speaks HTTP/1.1, so that's all it offers by default.
+    """
+    return new_server_ssl_context(
+        certfile,
+        keyfile,
+        ciphers=ciphers,
+        minimum_version=minimum_version,
+        maximum_version=maximum_version,
+        alpn_protocols=alpn_protocols,
+        session_tickets=session_tickets,
     )
+
+
+def new_server_ssl_context(
+    certfile,
+    keyfile=None,
+    *,
+    ciphers=None,
+    minimum_version=None,
+    maximum_version=None,
+    alpn_protocols=("http/1.1",),
+    session_tickets=True,
+) -> "ssl.SSLContext":
+    """
+    Like server_ssl_context, but a new context every time.
+    """
+    import ssl
+
+    logger.debug("server cert path: %s | server key path: %s", certfile, keyfile)
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+
+    if ciphers is not None:
+        context.set_ciphers(ciphers)
+    if minimum_version is not None:
+        context.minimum_version = minimum_version
+    if maximum_version is not None:
+        context.maximum_version = maximum_version
+    if alpn_protocols:
+        context.set_alpn_protocols(list(alpn_protocols))
+    if not session_tickets:
+        context.options |= ssl.OP_NO_TICKET
+
+    return context
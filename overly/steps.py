@@ -3,16 +3,48 @@
 #    partials, headers only etc.
 # 2. Add a way to config headers per steps set, keep-alive etc.
 
+__all__ = [
+    "finish",
+    "just_close",
+    "just_end",
+    "just_kill",
+    "send_request_as_json",
+    "accept_cookies_and_respond",
+    "prepare_cookies_response",
+    "send_gzip",
+    "send_deflate",
+    "send_chunked",
+    "send_200",
+    "send_file",
+    "send_range",
+    "send_200_blank_headers",
+    "send_204",
+    "send_3xx",
+    "send_301",
+    "send_302",
+    "send_303",
+    "send_304",
+    "send_400",
+    "send_403",
+    "send_404",
+    "send_405",
+    "method_check",
+    "send_500",
+    "receive_request",
+    "throttle",
+    "delay",
+    "async_delay",
+]
 
 import h11
 
-import time
-import json
-import gzip
 import zlib
-from functools import partial
+from typing import TYPE_CHECKING
+from functools import partial, lru_cache
 from urllib.parse import urlparse, unquote_plus
-from http.cookies import SimpleCookie
+
+# json, orjson, gzip, uuid and asyncio are imported by the steps using them,
+# which keeps importing overly quick.
 
 from .http_utils import (
     get_content_type,
@@ -22,15 +54,24 @@ from .http_utils import (
     cookies_to_headers,
     cookies_to_output,
     create_content_len_header,
+    get_header,
+    parse_range,
     parse_multipart,
     extract_multipart_form_file,
     extract_multipart_form_data,
     extract_multipart_json,
 )
+from .bodies import Body, FileBody
+from .compiled import static_response
+from .scheduler import Park
+from .bandwidth import TokenBucket, ThrottledBody
 from .errors import EndSteps
 
 from .errors import logger
 
+if TYPE_CHECKING:
+    from http.cookies import SimpleCookie
+
 
 # --------------
 # Response Endings
@@ -71,9 +112,13 @@ def just_kill():
 # ---------------------
 
 
-def send_request_as_json(client_handler, headers=None):
-    response_data = _prepare_request_as_json(client_handler)
-    logger.info("Request as json: {}".format(response_data))
+def send_request_as_json(client_handler, headers=None, fields=None):
+    """
+    Echo the request back as json. Pass fields to only include some of the
+    keys, like ("headers", "body").
+    """
+    response_data = _prepare_request_as_json(client_handler, fields)
+    logger.debug("Request as json: %s", response_data)
 
     response_headers = [
         ("connection", "close"),
@@ -87,74 +132,109 @@ def send_request_as_json(client_handler, headers=None):
     client_handler.http_send(
         h11.Response(
             status_code=200, http_version=b"1.1", reason=b"OK", headers=response_headers
-        )
+        ),
+        h11.Data(data=response_data),
     )
 
-    import pprint
 
-    pprint.pprint(response_data)
-
-    client_handler.http_send(h11.Data(data=response_data))
+def _prepare_request_as_json(client_handler, fields=None) -> bytes:
+    request = client_handler.request
+    wanted = _REQUEST_JSON_FIELDS if fields is None else frozenset(fields)
 
+    content_type = get_content_type(request.headers)
+    body = None
 
-def _prepare_request_as_json(client_handler) -> dict:
-    _, _, path, _, query, _ = urlparse(client_handler.request.target)
-
-    content_type = get_content_type(client_handler.request.headers)
+    def decoded_body():
+        nonlocal body
+        if body is None:
+            body = client_handler.request_body.decode()
+        return body
 
     data = {}
-    data["http_version"] = client_handler.request.http_version.decode()
-    data["method"] = client_handler.request.method.decode()
-    data["target"] = client_handler.request.target.decode()
-    data["path"] = path.decode()
-    data["files"] = []
-    data["forms"] = []
-    data["json"] = []
+    if "http_version" in wanted:
+        data["http_version"] = request.http_version.decode()
+    if "method" in wanted:
+        data["method"] = request.method.decode()
+    if "target" in wanted:
+        data["target"] = request.target.decode()
+    if "path" in wanted or "params" in wanted:
+        _, _, path, _, query, _ = urlparse(request.target)
+        if "path" in wanted:
+            data["path"] = path.decode()
+    if "files" in wanted:
+        data["files"] = []
+    if "forms" in wanted:
+        data["forms"] = []
+    if "json" in wanted:
+        data["json"] = []
 
     # add headers
-    data.update(
-        {
-            "headers": [
-                [header.decode(), value.decode()]
-                for header, value in client_handler.request.headers
-            ]
-        }
-    )
+    if "headers" in wanted:
+        data["headers"] = [
+            [header.decode(), value.decode()] for header, value in request.headers
+        ]
 
     # add query params
-    if query:
+    if "params" in wanted and query:
         data["params"] = extract_query(unquote_plus(query.decode()))
 
     # add application form data
-    if content_type == b"application/x-www-form-urlencoded":
-        data.update(
-            {
-                "form": extract_form_urlencoded(
-                    unquote_plus(client_handler.request_body.decode())
-                )
-            }
-        )
+    if "form" in wanted and content_type == b"application/x-www-form-urlencoded":
+        data["form"] = extract_form_urlencoded(unquote_plus(decoded_body()))
 
     # add json content
-    if content_type is not None and content_type.startswith(b"application/json"):
-        data["json"].append({"json": json.loads(client_handler.request_body)})
+    if (
+        "json" in wanted
+        and content_type is not None
+        and content_type.startswith(b"application/json")
+    ):
+        import json
+
+        data["json"].append({"json": json.loads(decoded_body())})
 
     # add multipart form data
-    if content_type is not None and content_type.startswith(b"multipart/form-data"):
-        parts = parse_multipart(content_type, client_handler.request_body)
+    if (
+        not wanted.isdisjoint(("files", "forms", "json"))
+        and content_type is not None
+        and content_type.startswith(b"multipart/form-data")
+    ):
+        if client_handler.multipart is not None:
+            # Parsed as the body arrived.
+            parts = client_handler.multipart.parts
+        else:
+            parts = parse_multipart(content_type, client_handler.request_body)
 
         for part in parts:
             if part.filename:
-                data["files"].append(extract_multipart_form_file(part))
+                if "files" in wanted:
+                    data["files"].append(extract_multipart_form_file(part))
             elif part.content_type.casefold() == "application/json":
-                data["json"].append(extract_multipart_json(part))
-            else:
+                if "json" in wanted:
+                    data["json"].append(extract_multipart_json(part))
+            elif "forms" in wanted:
                 data["forms"].append(extract_multipart_form_data(part))
 
-    data["body"] = client_handler.request_body.decode()
-    logger.info(client_handler.request_body.decode())
-
-    return json.dumps(data).encode()
+    if "body" in wanted:
+        data["body"] = decoded_body()
+
+    return _json_dumps(data)
+
+
+_REQUEST_JSON_FIELDS = frozenset(
+    (
+        "http_version",
+        "method",
+        "target",
+        "path",
+        "files",
+        "forms",
+        "json",
+        "headers",
+        "params",
+        "form",
+        "body",
+    )
+)
 
 
 def accept_cookies_and_respond(client_handler, headers=None, data=None):
@@ -183,21 +263,29 @@ def accept_cookies_and_respond(client_handler, headers=None, data=None):
     client_handler.http_send(h11.Data(data=response_data))
 
 
-def prepare_cookies_response(cookies: SimpleCookie) -> bytes:
+def prepare_cookies_response(cookies: "SimpleCookie") -> bytes:
+    import json
+
     cookies = {k: v for k, v in [cookie.split("=") for cookie in cookies]}
     data = {"cookies": cookies}
     return json.dumps(data).encode()
 
 
+@static_response()
 def send_gzip(client_handler, headers=None, data=None):
     response_data = data or b"200"
 
-    response_data = gzip.compress(_to_bytes(response_data))
+    if _is_chunks(response_data):
+        response_data = _compress_chunks(response_data, wbits=16 + zlib.MAX_WBITS)
+    else:
+        import gzip
+
+        response_data = gzip.compress(_to_bytes(response_data))
 
     response_headers = [
         ("connection", "close"),
         ("content-encoding", "gzip"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data),
     ]
 
     if headers is not None:
@@ -209,18 +297,22 @@ def send_gzip(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
+@static_response()
 def send_deflate(client_handler, headers=None, data=None):
     response_data = data or b"200"
 
-    response_data = zlib.compress(_to_bytes(response_data))
+    if _is_chunks(response_data):
+        response_data = _compress_chunks(response_data, wbits=zlib.MAX_WBITS)
+    else:
+        response_data = zlib.compress(_to_bytes(response_data))
 
     response_headers = [
         ("connection", "close"),
         ("content-encoding", "deflate"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data),
     ]
 
     if headers is not None:
@@ -232,10 +324,10 @@ def send_deflate(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
-def send_chunked(client_handler, headers=None, data: list = None):
+def send_chunked(client_handler, headers=None, data=None):
     response_data = data or [b"200"]
 
     response_headers = [("connection", "close"), ("transfer-encoding", "chunked")]
@@ -249,16 +341,18 @@ def send_chunked(client_handler, headers=None, data: list = None):
         )
     )
 
-    for chunk in response_data:
-        client_handler.http_send(h11.Data(data=_to_bytes(chunk)))
+    return _send_body(client_handler, response_data)
 
 
-def send_200(client_handler, headers=None, data=None, delay_body=None):
+@static_response("delay_body")
+def send_200(
+    client_handler, headers=None, data=None, delay_body=None, content_length=None
+):
     response_data = data or b"200"
 
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -271,12 +365,121 @@ def send_200(client_handler, headers=None, data=None, delay_body=None):
     )
 
     if delay_body is not None:
-        logger.info("Delaying body by {} seconds.".format(delay_body))
-        time.sleep(delay_body)
+        logger.debug("Delaying body by %s seconds.", delay_body)
+        return Park(delay_body, then=partial(_send_body, response_data=response_data))
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
+
+
+def send_file(client_handler, path, headers=None, content_type=None):
+    """
+    Send the file at path, with its content-type guessed from its name
+    unless given.
+    """
+    response_data = FileBody(path)
+
+    response_headers = [
+        ("connection", "close"),
+        ("content-type", content_type or response_data.content_type),
+        *_framing_headers(response_data),
+    ]
+
+    if headers is not None:
+        response_headers = _add_external_headers(response_headers, headers)
+
+    client_handler.http_send(
+        h11.Response(
+            status_code=200, http_version=b"1.1", reason=b"OK", headers=response_headers
+        )
+    )
+
+    return _send_body(client_handler, response_data)
+
+
+def send_range(
+    client_handler,
+    data=None,
+    path=None,
+    headers=None,
+    content_type=None,
+    etag=None,
+    last_modified=None,
+):
+    """
+    Send data (bytes or a Body), or the file at path, honouring any Range
+    header in the request. Only the requested slices are sent, as a 206,
+    or a multipart/byteranges 206 for several of them. Unsatisfiable ranges
+    get a 416. If-Range is checked against etag and last_modified.
+    """
+    response_data = FileBody(path) if path is not None else data or b"200"
+    size = len(response_data)
+    content_type = content_type or getattr(
+        response_data, "content_type", "application/octet-stream"
+    )
+
+    response_headers = [("connection", "close"), ("accept-ranges", "bytes")]
+    if etag is not None:
+        response_headers.append(("etag", etag))
+    if last_modified is not None:
+        response_headers.append(("last-modified", last_modified))
+
+    ranges = None
+    range_header = get_header(client_handler.request.headers, b"range")
+    if_range = get_header(client_handler.request.headers, b"if-range")
+    if range_header is not None and (
+        if_range is None or if_range.decode() in (etag, last_modified)
+    ):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None:
+        status_code, reason = 200, b"OK"
+        response_headers.append(("content-type", content_type))
+    elif not ranges:
+        status_code, reason = 416, b"RANGE NOT SATISFIABLE"
+        response_headers.append(("content-range", "bytes */{}".format(size)))
+        response_data = b""
+    elif len(ranges) == 1:
+        status_code, reason = 206, b"PARTIAL CONTENT"
+        start, end = ranges[0]
+        response_headers.extend(
+            [
+                ("content-type", content_type),
+                ("content-range", "bytes {}-{}/{}".format(start, end - 1, size)),
+            ]
+        )
+        response_data = _slice_body(response_data, start, end)
+    else:
+        status_code, reason = 206, b"PARTIAL CONTENT"
+        import uuid
+
+        boundary = uuid.uuid4().hex
+        response_headers.append(
+            ("content-type", "multipart/byteranges; boundary={}".format(boundary))
+        )
+        response_data, content_length = _byteranges(
+            response_data, ranges, size, content_type, boundary
+        )
+        response_headers.append(("content-length", str(content_length)))
+
+    if not any(header == "content-length" for header, _ in response_headers):
+        response_headers.extend(_framing_headers(response_data))
+
+    if headers is not None:
+        response_headers = _add_external_headers(response_headers, headers)
+
+    client_handler.http_send(
+        h11.Response(
+            status_code=status_code,
+            http_version=b"1.1",
+            reason=reason,
+            headers=response_headers,
+        )
+    )
+
+    return _send_body(client_handler, response_data)
 
 
+@static_response()
 def send_200_blank_headers(client_handler, headers=None):
     response_data = b"200"
 
@@ -294,11 +497,12 @@ def send_200_blank_headers(client_handler, headers=None):
     client_handler.http_send(h11.Data(data=response_data))
 
 
-def send_204(client_handler, headers=None, data=None):
+@static_response()
+def send_204(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b""
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -313,7 +517,7 @@ def send_204(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
 # ---------------------
@@ -321,13 +525,21 @@ def send_204(client_handler, headers=None, data=None):
 # ---------------------
 
 
-def send_3xx(status_code, reason_phrase, client_handler, headers=None, data=None):
+@static_response()
+def send_3xx(
+    status_code,
+    reason_phrase,
+    client_handler,
+    headers=None,
+    data=None,
+    content_length=None,
+):
     response_data = data or str(status_code).encode()
 
     response_headers = [
         ("location", client_handler.http_test_url),
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -342,7 +554,7 @@ def send_3xx(status_code, reason_phrase, client_handler, headers=None, data=None
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
 send_301 = partial(send_3xx, status_code=301, reason_phrase="MOVED PERMANENTLY")
@@ -350,13 +562,14 @@ send_302 = partial(send_3xx, status_code=302, reason_phrase="FOUND")
 send_303 = partial(send_3xx, 303, "SEE OTHER")
 
 
-def send_304(client_handler, headers=None, data=None):
+@static_response()
+def send_304(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b"304"
 
     response_headers = [
         ("location", client_handler.http_test_url),
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -371,7 +584,7 @@ def send_304(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
 # ---------------------
@@ -379,11 +592,12 @@ def send_304(client_handler, headers=None, data=None):
 # ---------------------
 
 
-def send_400(client_handler, headers=None, data=None):
+@static_response()
+def send_400(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b"400"
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -398,14 +612,15 @@ def send_400(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
-def send_403(client_handler, headers=None, data=None):
+@static_response()
+def send_403(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b"403"
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -420,14 +635,15 @@ def send_403(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
-def send_404(client_handler, headers=None, data=None):
+@static_response()
+def send_404(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b"404"
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -442,14 +658,15 @@ def send_404(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
-def send_405(client_handler, headers=None, data=None):
+@static_response()
+def send_405(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b"405"
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -464,7 +681,7 @@ def send_405(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
 def method_check(client_handler, correct_method):
@@ -481,11 +698,12 @@ def method_check(client_handler, correct_method):
 # ---------------------
 
 
-def send_500(client_handler, headers=None, data=None):
+@static_response()
+def send_500(client_handler, headers=None, data=None, content_length=None):
     response_data = data or b"I'm pretending to be broken >:D"
     response_headers = [
         ("connection", "close"),
-        create_content_len_header(response_data),
+        *_framing_headers(response_data, content_length),
     ]
 
     if headers is not None:
@@ -500,7 +718,7 @@ def send_500(client_handler, headers=None, data=None):
         )
     )
 
-    client_handler.http_send(h11.Data(data=response_data))
+    return _send_body(client_handler, response_data)
 
 
 # -------------------------
@@ -515,23 +733,57 @@ def receive_request(client_handler):
     when multiple steps are defined.
     """
     request = client_handler.http_next_event()
+    client_handler.start_request_body(request)
     while True:
         event = client_handler.http_next_event()
         if isinstance(event, h11.EndOfMessage):
             break
         elif isinstance(event, h11.Data):
-            client_handler.request_body += event.data
+            client_handler.receive_body_data(event.data)
 
     client_handler.request = request
 
 
+def throttle(rate, burst=None, jitter=0):
+    """
+    Cap the bytes a second the rest of the response's body is sent at.
+    Bursts of up to burst bytes are allowed, and the waits between sends
+    vary by up to +/- jitter (a fraction). Pacing is done by parking the
+    client handler, so no thread sleeps through it.
+    """
+
+    def throttle_(rate, burst, jitter, client_handler):
+        client_handler.throttle = TokenBucket(rate, burst, jitter)
+
+    return partial(throttle_, rate, burst, jitter)
+
+
 def delay(t=0):
+    """
+    Wait t seconds before carrying on. The client handler is parked with
+    the server's scheduler meanwhile, so no thread is held up.
+    """
+
     def delay_(t, *_):
-        time.sleep(t)
+        return Park(t)
 
     return partial(delay_, t)
 
 
+def async_delay(t=0):
+    """
+    Awaitable counterpart to delay. Either is fine on AsyncServer, which
+    waits out delay's Park without blocking its loop.
+    """
+
+    async def async_delay_(t, *_):
+        import asyncio
+
+        await asyncio.sleep(t)
+
+    return partial(async_delay_, t)
+
+
 # ---------------
 # Internal utils
 # ---------------
@@ -554,6 +806,116 @@ def _add_external_headers(internal_headers, external_headers):
 def _to_bytes(data, encoding="utf-8") -> bytes:
     if isinstance(data, str):
         return data.encode(encoding)
-    elif isinstance(data, bytes):
+    elif isinstance(data, (bytes, bytearray, memoryview)):
         return data
     raise TypeError(f"Can't convert {type(data)} to bytes.")
+
+
+def _is_chunks(data) -> bool:
+    """
+    Bodies are either a single bytes-like object, or any iterable of them
+    (lists, generators...) which is streamed out chunk by chunk.
+    """
+    return not isinstance(data, (bytes, bytearray, memoryview, str))
+
+
+def _framing_headers(response_data, content_length=None) -> list:
+    """
+    Headers declaring how the body is framed. Chunks of unknown total length
+    are sent chunked.
+    """
+    if content_length is not None:
+        return [("content-length", str(content_length).encode())]
+    if isinstance(response_data, Body):
+        return [("content-length", str(len(response_data)).encode())]
+    if _is_chunks(response_data):
+        return [("transfer-encoding", "chunked")]
+    return [create_content_len_header(response_data)]
+
+
+def _send_body(client_handler, response_data):
+    """
+    Send the body in one go, or chunk by chunk so that it never needs to
+    be held in memory in full.
+
+    If the connection is throttled, returns a Park to be handed back from
+    the step, which sends the body bit by bit as bandwidth allows.
+    """
+    buckets = client_handler.bandwidth_buckets()
+    if buckets:
+        if _is_chunks(response_data):
+            chunks = (_to_bytes(chunk) for chunk in response_data)
+        else:
+            chunks = [response_data]
+        return ThrottledBody(chunks, buckets)(client_handler)
+
+    if isinstance(response_data, FileBody):
+        client_handler.http_sendfile(response_data)
+    elif _is_chunks(response_data):
+        client_handler.http_send_chunks(_to_bytes(chunk) for chunk in response_data)
+    else:
+        client_handler.http_send(h11.Data(data=response_data))
+
+
+def _slice_body(response_data, start, end):
+    if isinstance(response_data, Body):
+        return response_data.slice(start, end)
+    return memoryview(_to_bytes(response_data))[start:end]
+
+
+def _byteranges(response_data, ranges, size, content_type, boundary):
+    """
+    A multipart/byteranges body for the ranges, and its length.
+    """
+    parts = []
+    for start, end in ranges:
+        part_headers = (
+            "--{}\r\n"
+            "content-type: {}\r\n"
+            "content-range: bytes {}-{}/{}\r\n\r\n"
+        ).format(boundary, content_type, start, end - 1, size)
+        part_headers = part_headers.encode()
+        parts.append((part_headers, _slice_body(response_data, start, end)))
+    closing = "--{}--\r\n".format(boundary).encode()
+
+    content_length = len(closing) + sum(
+        len(part_headers) + len(part) + 2 for part_headers, part in parts
+    )
+
+    def chunks():
+        for part_headers, part in parts:
+            yield part_headers
+            if isinstance(part, Body):
+                yield from part
+            else:
+                yield part
+            yield b"\r\n"
+        yield closing
+
+    return chunks(), content_length
+
+
+def _compress_chunks(chunks, wbits):
+    compressor = zlib.compressobj(wbits=wbits)
+    for chunk in chunks:
+        yield compressor.compress(_to_bytes(chunk))
+    yield compressor.flush()
+
+
+def _json_dumps(obj) -> bytes:
+    """
+    Serialize obj to json bytes, with orjson if it's installed.
+    """
+    return _json_dumper()(obj)
+
+
+@lru_cache(maxsize=None)
+def _json_dumper():
+    # Looked for on first use, as importing orjson isn't free.
+    try:
+        import orjson
+    except ImportError:
+        import json
+
+        return lambda obj: json.dumps(obj).encode()
+    return orjson.dumps
@@ -0,0 +1,70 @@
+from threading import Thread, Lock
+from queue import Queue
+
+from .errors import logger
+
+
+class WorkerPool:
+    """
+    A set of long lived threads, which run client handlers pulled off a
+    queue rather than each handler getting a thread of its own.
+
+    size threads are started up front. Given a bigger max_size, more are
+    started when everything's busy, up to max_size, and kept for reuse.
+    """
+
+    def __init__(self, size: int, max_size: int = None):
+        self.size = size
+        self.max_size = max(size, max_size or size)
+        self.jobs = Queue()
+        self.threads = []
+
+        # Threads waiting on a job that no submitted job is due to wake.
+        self.idle = 0
+        self.lock = Lock()
+
+    def start(self) -> None:
+        with self.lock:
+            for _ in range(self.size):
+                self.idle += 1
+                self.start_thread()
+
+    def start_thread(self) -> None:
+        thread = Thread(target=self.work, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def submit(self, client_handler) -> None:
+        with self.lock:
+            if self.idle:
+                self.idle -= 1
+            elif len(self.threads) < self.max_size:
+                self.start_thread()
+        self.jobs.put(client_handler)
+
+    def work(self) -> None:
+        while True:
+            client_handler = self.jobs.get()
+            if client_handler is None:
+                return
+            try:
+                client_handler.run()
+            except SystemExit:
+                # Raised by handlers told to die by the server. The pool is
+                # shut down right after, so just carry on.
+                ...
+            except Exception:
+                logger.exception("Client handler failed.")
+            with self.lock:
+                self.idle += 1
+
+    def shutdown(self) -> None:
+        """
+        Let the workers finish what's queued, then stop them.
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.jobs.put(None)
+        for thread in threads:
+            thread.join()
@@ -15,6 +15,7 @@ setup(
     packages=['overly'],
     include_package_data=True,
     install_requires=['h11', 'sansio_multipart'],
+    extras_require={'orjson': ['orjson'], 'sni': ['cryptography']},
     classifiers=[
         'Programming Language :: Python :: 3',
         'Intended Audience :: Developers',